@@ -13,7 +13,6 @@ import os
 import os.path
 import sys
 import json
-import unittest2
 try:
     from urllib.request import urlopen
 except:
@@ -41,6 +40,8 @@ Example use:
  bft -b ap148 --testsuite flash_only -m http://10.0.0.101/nand-ipq806x-single.img
 
  bft -b ap135 --testsuite preflight -r http://10.0.0.101/openwrt-ar71xx-generic-ap135-rootfs-squashfs.bin
+
+ bft -b ap148 --testsuite daily --parallel 4 -m http://10.0.0.101/nand-ipq806x-single.img
 '''
 
 def parse():
@@ -71,6 +72,10 @@ def parse():
     parser.add_argument('-a', '--analysis', metavar='', type=str, default=None, help='Only run post processing analysis on logs')
     owrt_tests_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "results", '')
     parser.add_argument('-o', '--output_dir', metavar='', type=str, default=owrt_tests_dir, help='Directory to output results files too')
+    parser.add_argument('-P', '--parallel', metavar='', type=int, default=1, help='Split test suite across this many boards, one worker per board')
+    parser.add_argument('--resume', metavar='', type=str, default=None, help='Output directory of an interrupted run, finish its tests')
+    parser.add_argument('--plan', action='store_true', help='Reorder tests to avoid restoring board state between them')
+    parser.add_argument('--broker', action='store_true', help='Keep device sessions open between runs, using a session broker')
     parser.add_argument('-c', '--config_file', metavar='', type=str, default=boardfarm_config_location, help='JSON config file for boardfarm')
 
     args = parser.parse_args()
@@ -78,14 +83,11 @@ def parse():
     if args.list_tests:
         import tests
         # Print all classes that are a subclass of TestCase
-        for e in dir(tests):
-            thing = getattr(tests, e)
-            if inspect.isclass(thing) and \
-               issubclass(thing, unittest2.TestCase):
-                try:
-                    print("%20s - %s" % (e, thing.__doc__.split('\n')[0]))
-                except:
-                    print("%20s -" % e)
+        for name, info in sorted(tests.registry().items()):
+            if info['doc']:
+                print("%20s - %s" % (name, info['doc']))
+            else:
+                print("%20s -" % name)
         sys.exit(0)
 
     try:
@@ -135,13 +137,14 @@ def parse():
     config.ROOTFS = args.rootfs
     config.META_BUILD = args.meta_img_loc
     # Quick check to make sure file url/path arguments are reasonable
-    for x in (config.UBOOT, config.KERNEL, config.ROOTFS, config.META_BUILD):
+    from devices import staging
+    for x in [config.UBOOT, config.KERNEL, config.ROOTFS, config.META_BUILD] + config.INSTALL_PKGS.split():
         if x is None:
             continue
-        if x.startswith('http://') or x.startswith('https://'):
+        if staging.is_url(x):
             try:
                 # If url returns 404 or similar, raise exception
-                urlopen(x, timeout=20)
+                staging.head(x)
             except Exception as e:
                 print(e)
                 print('Error trying to access %s' % x)
@@ -207,7 +210,7 @@ def parse():
             print("ERROR! No boards meet selection requirements and have available_for_autotests = True.")
             sys.exit(1)
     else:
-        if not args.board_names:
+        if not args.board_names and not args.resume:
             print("ERROR")
             print("You must specify a board name with the '-n' argument:")
             print("./run-all.py -n 3000")
@@ -219,6 +222,21 @@ def parse():
 
     config.WAN_PROTO = args.wan
     config.reboot_vms = args.reboot_vms
+    config.broker = args.broker
+    config.plan = args.plan
+    config.parallel = args.parallel
+    config.resume = args.resume
+    if config.resume:
+        # Same board, tests and images as the interrupted run
+        try:
+            library.read_run_state(config, config.resume)
+        except:
+            sys.exit(1)
+        config.plan = False
+        config.parallel = 1
+    if config.parallel > 1 and len(config.BOARD_NAMES) < 2:
+        library.print_bold("Only one board available, ignoring --parallel.")
+        config.parallel = 1
 
     return config
 
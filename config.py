@@ -14,6 +14,37 @@ boardfarm_config_location = 'boardfarm_config_example.json'
 # Test Suite config files. Standard python config file format.
 testsuite_config_files = [os.path.join(os.path.dirname(os.path.realpath(__file__)), 'testsuites.cfg'), ]
 
+# Local store of how long each test took on each type of board.
+# Used to split test suites evenly when running on several boards.
+test_timings_file = os.path.join(os.path.expanduser('~'), '.bft', 'test_timings.json')
+
+# Local store of how long flashing each partition took on each type
+# of board, to record the time saved when an unchanged one is skipped.
+flash_timings_file = os.path.join(os.path.expanduser('~'), '.bft', 'flash_timings.json')
+
+# Bytes of console output of a device to keep in memory, more is
+# moved to a temporary file.
+console_log_max_memory = 64 * 1024 * 1024
+
+# Bytes of images to keep cached on the tftp server between runs, the
+# least recently used are removed first.
+tftp_cache_size = 4 * 1024 * 1024 * 1024
+# Seconds since another run last used an image before it may be removed.
+tftp_cache_min_age = 10 * 60
+
+# Serve images to boards with devices/tftp_server.py on the wan device,
+# instead of tftpd-hpa. It lets U-Boot use large blocks and windows.
+builtin_tftp_server = False
+# Bytes per block and blocks per ack U-Boot asks for, with the builtin
+# server. U-Boot sends windowsize only from v2020.04 on.
+tftp_blocksize = 1468
+tftp_windowsize = 16
+
+# Local copies of images downloaded from the web, reused by later runs
+# while the web server reports the same version, and their total size.
+image_cache_dir = os.path.join(os.path.expanduser('~'), '.bft', 'images')
+image_cache_size = 10 * 1024 * 1024 * 1024
+
 # Logstash server - a place to send JSON-format results to
 # when finished. Set to None or name:port, e.g. 'logstash.mysite.com:1300'
 logging_server = None
@@ -4,6 +4,10 @@
     devices over a network.
 
 '''
+import threading
+
+import prompts
+
 board = None
 lan = None
 wan = None
@@ -11,24 +15,155 @@ wlan = None
 wlan2g = None
 wlan5g = None
 prompt = None
+
+# Devices that may be attached to a board: (name, prefix of their
+# settings in the board farm config, console color)
+station_devices = [('wan', 'wan', 'cyan'),
+                   ('lan', 'lan', 'blue'),
+                   ('wlan', 'wlan', 'green'),
+                   ('wlan5g', '5g', 'grey'),
+                   ('wlan2g', '2g', 'magenta')]
+
+
+class DeviceProxy(object):
+    '''
+    Stands in for a device that is only connected to the first time it
+    is used. Tests import and use it just like the device itself.
+
+    Evaluates to False if the device could not be connected to, so that
+    "if wlan:" still works for optional devices.
+    '''
+
+    def __init__(self, name, connect, prompt):
+        self.__dict__['_name'] = name
+        self.__dict__['_connect'] = connect
+        self.__dict__['_prompt'] = prompt
+        self.__dict__['_device'] = None
+        self.__dict__['_error'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _get(self):
+        '''Return the connected device, connecting if needed.'''
+        with self._lock:
+            if self._device is None:
+                if self._error is not None:
+                    raise Exception("%s device is unavailable (%s)" % (self._name, self._error))
+                try:
+                    self.__dict__['_device'] = self._connect()
+                except Exception as e:
+                    self.__dict__['_error'] = e
+                    raise
+            return self._device
+
+    def _available(self):
+        try:
+            self._get()
+        except Exception:
+            return False
+        return True
+
+    def __nonzero__(self):
+        return self._available()
+    __bool__ = __nonzero__
+
+    def __getattr__(self, attr):
+        # Combining prompts should not require a connection
+        if attr == 'prompt' and self._device is None:
+            return self._prompt
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._get(), attr, value)
+
+    def __repr__(self):
+        if self._device is None:
+            return "<%s device, not connected>" % self._name
+        return repr(self._device)
+
+
+def debian_connector(configuration, key, color):
+    '''Return a function that connects to a debian device of the board.'''
+    import debian_decider
+    b = configuration.board
+    kwargs = dict(color=color, reboot=configuration.reboot_vms,
+                  username=b.get('%s_username' % key, "root"),
+                  password=b.get('%s_password' % key, "bigfoot1"),
+                  port=b.get('%s_port' % key, "22"))
+    if key == 'wan':
+        kwargs['location'] = b.get('location')
+    return lambda: debian_decider.debian(b.get('%s_device' % key), **kwargs)
+
+
 def initialize_devices(configuration):
     # Init random global variables. To Do: clean these.
     global power_ip, power_outlet
+    import debian_decider
     conn_cmd = configuration.board.get('conn_cmd')
     power_ip = configuration.board.get('powerip', None)
     power_outlet = configuration.board.get('powerport', None)
     # Init devices
     global board, lan, wan, wlan, wlan2g, wlan5g, prompt
     board = configuration.console
-    lan = configuration.lan
-    wan = configuration.wan
-    wlan = configuration.wlan
-    wlan2g = configuration.wlan2g
-    wlan5g = configuration.wlan5g
+    # Other devices are only connected to when first used
+    for name, key, color in station_devices:
+        dev = None
+        if configuration.board.get('%s_device' % key):
+            cls = debian_decider.debian_class(configuration.board.get('%s_username' % key, "root"))
+            dev = DeviceProxy(name, debian_connector(configuration, key, color), cls.prompt)
+        setattr(configuration, name, dev)
+        globals()[name] = dev
     board.root_type = None
     # Next few lines combines all the prompts into one list of unique prompts.
     # It lets test writers use "some_device.expect(prompt)"
     prompt = []
     for d in (board, lan, wan, wlan):
         prompt += getattr(d, "prompt", [])
-    prompt = list(set(prompt))
+    prompt = prompts.Prompt(set(prompt))
+
+
+def available(name):
+    '''
+    Return False if the named device is attached to the board but
+    cannot be connected to, True otherwise.
+    '''
+    dev = globals().get(name)
+    if isinstance(dev, DeviceProxy):
+        return dev._available()
+    return True
+
+
+def connect(names):
+    '''
+    Connect to the named devices at the same time, rather than one by one
+    when first used. Report each device that fails, and return their names.
+    '''
+    from multiprocessing.pool import ThreadPool
+    proxies = [(n, globals().get(n)) for n in sorted(set(names))]
+    proxies = [(n, d) for n, d in proxies if isinstance(d, DeviceProxy)]
+    if not proxies:
+        return []
+    pool = ThreadPool(len(proxies))
+    results = [(n, pool.apply_async(d._get)) for n, d in proxies]
+    pool.close()
+    failed = []
+    for n, r in results:
+        try:
+            r.get()
+        except Exception as e:
+            print(e)
+            print("Unable to connect to %s device, tests needing it will be skipped." % n)
+            failed.append(n)
+    pool.join()
+    return failed
+
+
+def connected_devices():
+    '''Return all devices that have a session open.'''
+    result = [board]
+    for name, key, color in station_devices:
+        dev = globals().get(name)
+        if isinstance(dev, DeviceProxy):
+            dev = dev._device
+        if dev is not None:
+            result.append(dev)
+    return result
@@ -8,12 +8,62 @@
 import pexpect
 from termcolor import colored
 from datetime import datetime
+import random
 import re
+import time
+
+import boot_stages
+import console_log
+import error_detect
+import expect_trace
+import prompts
+import tasks
+
+
+class CommandResult(object):
+    '''Output, exit status and seconds taken by a command run on a device.'''
+
+    def __init__(self, cmd, output, status, duration):
+        self.cmd = cmd
+        self.output = output
+        self.status = status
+        self.duration = duration
+
+    def __nonzero__(self):
+        return self.status == 0
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return "<%r: exit status %s after %.2fs>" % (self.cmd, self.status, self.duration)
 
 
 class BaseDevice(pexpect.spawn):
 
-    prompt = ['root\\@.*:.*#', ]
+    prompt = prompts.Prompt(['root\\@.*:.*#', ])
+
+    def expect(self, pattern, timeout=-1, searchwindowsize=-1, *args, **kwargs):
+        '''
+        Like pexpect's expect(), but a Prompt is searched for with one
+        precompiled search. The index of the prompt found is returned
+        and kept in self.matched_prompt. Every call is recorded, see
+        expect_trace.py.
+        '''
+        start = time.time()
+        try:
+            if not isinstance(pattern, prompts.Prompt) or not pattern or args or kwargs:
+                return super(BaseDevice, self).expect(pattern, timeout, searchwindowsize, *args, **kwargs)
+            if timeout == -1:
+                timeout = self.timeout
+            if searchwindowsize == -1:
+                searchwindowsize = self.searchwindowsize
+            self.matched_prompt = self.expect_loop(prompts.PromptSearcher(pattern), timeout, searchwindowsize)
+            return self.matched_prompt
+        finally:
+            expect_trace.record(self, pattern, start)
+
+    def detect_fatal_error(self):
+        '''Handle crashes found in the output so far, see error_detect.py.'''
+        pass
 
     def get_interface_ipaddr(self, interface):
         self.sendline("\nifconfig %s" % interface)
@@ -43,16 +93,132 @@ class BaseDevice(pexpect.spawn):
             raise Exception("Command did not complete within %s seconds. Prompt was not seen." % timeout)
         return self.before
 
+    def run(self, cmd, timeout=30, check=False, prompt=None):
+        '''
+        Run a shell command and return a CommandResult with its output,
+        exit status and duration. Output is found between markers echoed
+        before and after the command, so no guessing from what it prints.
+        If check is True, raise an exception if the command failed.
+
+        Works in U-Boot too, if its shell sets $?. Pass prompt=self.uprompt
+        there. If the shell does not set $?, status is None.
+        '''
+        if prompt is None:
+            prompt = self.prompt
+        tag = self.send_run(cmd)
+        self.expect("%s_begin\r\n" % tag, timeout=10)
+        start = time.time()
+        try:
+            self.expect("%s_end_(\S*)\r\n" % tag, timeout=timeout)
+        except pexpect.TIMEOUT:
+            self.sendcontrol('c')
+            self.expect(prompt)
+            raise Exception("Command '%s' did not complete within %s seconds." % (cmd, timeout))
+        result = self.run_result(cmd, start)
+        self.expect(prompt, timeout=timeout)
+        if check and result.status != 0:
+            raise Exception("Command '%s' failed with exit status %s:\n%s" % (cmd, result.status, result.output))
+        return result
+
+    def run_task(self, cmd, timeout=30, check=False, prompt=None):
+        '''
+        Like run(), as a task to give to tasks.gather(), so commands on
+        several devices run at the same time.
+        '''
+        if prompt is None:
+            prompt = self.prompt
+        tag = self.send_run(cmd)
+        yield self.expect_task("%s_begin\r\n" % tag, timeout=10)
+        start = time.time()
+        try:
+            yield self.expect_task("%s_end_(\S*)\r\n" % tag, timeout=timeout)
+        except pexpect.TIMEOUT:
+            self.sendcontrol('c')
+            yield self.expect_task(prompt)
+            raise Exception("Command '%s' did not complete within %s seconds." % (cmd, timeout))
+        result = self.run_result(cmd, start)
+        yield self.expect_task(prompt, timeout=timeout)
+        if check and result.status != 0:
+            raise Exception("Command '%s' failed with exit status %s:\n%s" % (cmd, result.status, result.output))
+        raise tasks.Return(result)
+
+    def send_run(self, cmd):
+        '''Type cmd between markers, see run(). Return the tag of the markers.'''
+        tag = "BFT%06x" % random.getrandbits(24)
+        sep = ' ' if cmd.rstrip().endswith('&') else '; '
+        # quotes split the markers, so the echo of the line never matches them
+        self.sendline('echo "%s""_begin"; %s%secho "%s""_end_$?"' % (tag, cmd, sep, tag))
+        return tag
+
+    def run_result(self, cmd, start):
+        '''Return the CommandResult of cmd, once its end marker matched.'''
+        output = self.before.strip('\r\n')
+        status = self.match.group(1)
+        status = int(status) if status.isdigit() else None
+        return CommandResult(cmd, output, status, time.time() - start)
+
+    def expect_task(self, pattern, timeout=-1):
+        '''What a task yields to wait for pattern, see tasks.py.'''
+        return tasks.Expect(self, pattern, timeout)
+
+    # Longest line of commands to type at once, shells and serial
+    # consoles drop input past their line buffer
+    batch_line_length = 1000
+
+    def run_batch(self, cmds, timeout=30, check=True):
+        '''
+        Run a list of shell commands, typing as many as fit on one line
+        at once instead of waiting for a prompt after each. Each command
+        is followed by a marker holding its exit status.
+
+        Return a list of (output, exit status), one per command. If check
+        is True, raise an exception naming the first command that failed.
+        Commands must not wait for input.
+        '''
+        tag = "BFT%06x" % random.getrandbits(24)
+        lines = [[]]
+        length = 0
+        for i, cmd in enumerate(cmds):
+            # quotes split the marker, so the echo of the line never matches it
+            marker = 'echo "%s""_%d_$?"' % (tag, i)
+            sep = ' ' if cmd.rstrip().endswith('&') else '; '
+            part = cmd + sep + marker
+            if lines[-1] and length + len(part) > self.batch_line_length:
+                lines.append([])
+                length = 0
+            lines[-1].append(part)
+            length += len(part) + 2
+
+        results = []
+        for line in lines:
+            self.sendline("; ".join(line))
+            for part in line:
+                i = len(results)
+                self.expect("%s_%d_(\d+)\r\n" % (tag, i), timeout=timeout)
+                output = self.before
+                if part is line[0]:
+                    # skip the echo of the line typed
+                    output = output.split('\r\n', 1)[-1]
+                results.append((output.strip('\r\n'), int(self.match.group(1))))
+            self.expect(self.prompt, timeout=timeout)
+
+        if check:
+            for cmd, (output, status) in zip(cmds, results):
+                if status != 0:
+                    raise Exception("Command '%s' failed with exit status %s:\n%s" % (cmd, status, output))
+        return results
+
     def write(self, string):
         self._logfile_read.write(string)
-        self.log += string
 
     def set_logfile_read(self, value):
         class o_helper():
             def __init__(self, out, color):
                 self.color = color
                 self.out = out
-                self.log = ""
+                self.log = console_log.ConsoleLog()
+                self.scanner = error_detect.Scanner()
+                self.stages = boot_stages.Tracker()
                 self.start = datetime.now()
             def write(self, string):
                 if self.color is not None:
@@ -62,11 +228,14 @@ class BaseDevice(pexpect.spawn):
                 td = datetime.now()-self.start
                 ts = (td.microseconds + (td.seconds + td.days * 24 * 3600) * 10**6) / 10**6
                 # check for the split case
-                if len(self.log) > 1 and self.log[-1] == '\r' and string[0] == '\n':
+                if len(self.log) > 1 and self.log.endswith('\r') and string[0] == '\n':
                     tmp = '\n [%s]' % ts
                     tmp += string[1:]
                     string = tmp
-                self.log += re.sub('\r\n', '\r\n[%s] ' % ts, string)
+                string = re.sub('\r\n', '\r\n[%s] ' % ts, string)
+                self.scanner.scan(string, len(self.log))
+                self.stages.scan(string, len(self.log), time.time())
+                self.log.append(string, td.total_seconds())
             def flush(self):
                 self.out.flush()
 
@@ -76,8 +245,18 @@ class BaseDevice(pexpect.spawn):
     def get_log(self):
         return self._logfile_read.log
 
+    def get_error_events(self):
+        '''(offset in log, name, text) of each error found in the console, see error_detect.py.'''
+        return self._logfile_read.scanner.events
+
+    def get_boot_stages(self):
+        '''Stages of the boot seen in the console, see boot_stages.py.'''
+        return self._logfile_read.stages
+
     logfile_read = property(get_logfile_read, set_logfile_read)
     log = property(get_log)
+    error_events = property(get_error_events)
+    boot_stages = property(get_boot_stages)
 
     # perf related
     def parse_sar_iface_pkts(self, wan, lan):
@@ -0,0 +1,176 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Split the boot of a board into timed stages, from its console log.
+
+Each mark below is found in the console output of a boot, and the time
+it was read comes from the index of the console log. A stage lasts from
+one mark to the next:
+
+  uboot        U-Boot banner until the autoboot prompt
+  uboot_shell  U-Boot commands: setenv, dhcp, ping, ...
+  tftp         one tftp transfer, with its bytes per second
+  erase        erasing flash
+  write        writing flash
+  verify       checking what was written
+  kernel       "Starting kernel" until "Please press Enter"
+  userspace    "Please press Enter" until the first shell prompt
+
+  timeline = boot_profile.profile(board.log, start)
+  boot_profile.write_waterfall(timeline, "boot_waterfall.png")
+
+Charts need matplotlib, without it write_waterfall() does nothing.
+'''
+
+import re
+
+import boot_stages
+
+# Stages of boot_stages.py that are marks too
+_stage = dict(boot_stages.stages)
+
+# (mark, regular expression, stage starting at the mark)
+marks = [('uboot', _stage['uboot'], 'uboot'),
+         ('autoboot', 'Hit any key', 'uboot_shell'),
+         ('tftp', 'TFTP from server', 'tftp'),
+         ('tftp_done', 'Bytes transferred = (?P<bytes>\d+)', 'uboot_shell'),
+         ('erase', 'nand erase |sf erase |\\berase (?:0x|\$)', 'erase'),
+         ('write', 'nand write|sf write |cp\.b ', 'write'),
+         ('verify', 'crc32 |cmp\.b ', 'verify'),
+         ('kernel', _stage['kernel'], 'kernel'),
+         ('console', _stage['console'], 'userspace'),
+         ('prompt', 'root@[^\s:]+:\S*# ', None)]
+
+regex = re.compile("|".join("(?P<%s>%s)" % (name, r) for name, r, stage in marks))
+stage_of = dict((name, stage) for name, r, stage in marks)
+
+# Colors of stages in waterfall charts
+colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f']
+
+# matplotlib.pyplot once looked for, False if it is not installed
+_pyplot = None
+
+
+class Stage(object):
+    '''A stage of a boot: its name, start in seconds since the first mark, and duration.'''
+
+    def __init__(self, name, start, seconds, nbytes=None):
+        self.name = name
+        self.start = start
+        self.seconds = seconds
+        # bytes transferred, for tftp
+        self.nbytes = nbytes
+
+    def rate(self):
+        '''Bytes per second, for tftp.'''
+        if self.nbytes is None:
+            return None
+        return self.nbytes / max(self.seconds, 0.001)
+
+    def __repr__(self):
+        s = "%-12s %8.1f s %8.1f s" % (self.name, self.start, self.seconds)
+        if self.nbytes is not None:
+            s += "  %d bytes at %.1f kB/s" % (self.nbytes, self.rate() / 1024)
+        return s
+
+
+def profile(log, start=0, end=None):
+    '''
+    Return the stages of the boot in the console log between offsets
+    start and end, as a list of Stage. The last mark, usually the first
+    shell prompt, only ends a stage.
+    '''
+    found = []
+    for m in regex.finditer(log.read(start, end)):
+        name = m.lastgroup
+        if name == 'prompt' and (not found or found[-1][0] != 'console'):
+            # only the first prompt once Linux is up is a mark
+            continue
+        if found and found[-1][0] == name:
+            # e.g. "Booting Linux" after "Starting kernel", same stage
+            continue
+        t = log.time_at(start + m.start())
+        if t is None:
+            continue
+        nbytes = int(m.group('bytes')) if name == 'tftp_done' else None
+        found.append((name, t, nbytes))
+        if name == 'prompt':
+            break
+    if not found:
+        return []
+    t0 = found[0][1]
+    timeline = []
+    for (name, t, nbytes), (next_name, next_t, next_bytes) in zip(found, found[1:]):
+        stage = stage_of[name]
+        if stage is None:
+            continue
+        timeline.append(Stage(stage, t - t0, next_t - t,
+                              next_bytes if next_name == 'tftp_done' and stage == 'tftp' else None))
+    return timeline
+
+
+def summary(timeline):
+    '''
+    Return values to log for a timeline: total seconds of each kind of
+    stage, the average tftp rate, and the timeline itself.
+    '''
+    ret = {}
+    for s in timeline:
+        key = 'boot_%s_seconds' % s.name
+        ret[key] = round(ret.get(key, 0) + s.seconds, 1)
+    tftp = [s for s in timeline if s.nbytes is not None]
+    if tftp:
+        seconds = max(sum(s.seconds for s in tftp), 0.001)
+        ret['boot_tftp_kBps'] = round(sum(s.nbytes for s in tftp) / 1024.0 / seconds, 1)
+    if timeline:
+        ret['boot_total_seconds'] = round(timeline[-1].start + timeline[-1].seconds, 1)
+    ret['boot_timeline'] = [[s.name, round(s.start, 1), round(s.seconds, 1)] for s in timeline]
+    return ret
+
+
+def pyplot():
+    '''Return matplotlib.pyplot, or False if there is no matplotlib.'''
+    global _pyplot
+    if _pyplot is None:
+        try:
+            import matplotlib as mpl
+            mpl.use('Agg')
+            import matplotlib.pyplot as plt
+            _pyplot = plt
+        except ImportError:
+            _pyplot = False
+    return _pyplot
+
+
+def write_waterfall(timeline, fname, title=None):
+    '''
+    Draw the timeline as a waterfall chart, into PNG file fname. Return
+    False, without drawing it, if matplotlib is not installed.
+    '''
+    plt = pyplot()
+    if not plt:
+        return False
+    stages = [stage for name, r, stage in marks if stage is not None]
+    color = dict((stage, colors[stages.index(stage) % len(colors)]) for stage in stages)
+    fig, ax = plt.subplots(figsize=(10, 1 + 0.25 * len(timeline)))
+    for i, s in enumerate(timeline):
+        ax.barh(i, max(s.seconds, 0.1), left=s.start, color=color[s.name])
+        label = "%.1f s" % s.seconds
+        if s.nbytes is not None:
+            label += ", %.0f kB/s" % (s.rate() / 1024)
+        ax.text(s.start + s.seconds, i, " " + label, va='center', fontsize=7)
+    ax.set_yticks(range(len(timeline)))
+    ax.set_yticklabels([s.name for s in timeline], fontsize=7)
+    ax.invert_yaxis()
+    ax.set_xlabel("seconds since the first mark")
+    if title:
+        ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(fname)
+    plt.close(fig)
+    return True
@@ -0,0 +1,200 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Follow a board through its boot, and wait until it is ready.
+
+The console output of a board is followed as it is logged, and each
+stage of the boot is noted with the time it was reached:
+
+  uboot -> kernel -> init -> procd -> console
+
+Then readiness is checked on the board itself, instead of sleeping:
+
+  prompt    the shell answers
+  network   netifd reports the lan and wan interfaces up, with an
+            address ("ubus call network.interface dump"). netifd only
+            brings an interface up once its device has carrier.
+  services  procd reports every instance of every service running
+  firewall  fw3 has loaded its rules
+
+  board.wait_until('console', timeout=150)
+  board.wait_until('network')
+'''
+
+import json
+import re
+import time
+
+import pexpect
+
+# Stages of a boot seen on the console, in order: (name, regular expression).
+# Matches must not span lines, and be shorter than Tracker.carry.
+stages = [('uboot', 'U-Boot \d+\.\d+'),
+          ('kernel', 'Starting kernel|Booting Linux'),
+          ('init', 'Freeing unused kernel memory|Run /sbin/init'),
+          ('procd', 'procd: - (?:early|init) -'),
+          ('console', 'Please press Enter to activate this console')]
+
+# Seconds between checks of the board
+poll_interval = 1
+
+
+class Tracker(object):
+    '''
+    Notes the stages of a boot in console output as it is logged, with
+    one pass of one regular expression over each new chunk, like
+    error_detect.Scanner.
+    '''
+
+    # Bytes of the previous chunk searched again
+    carry = 64
+
+    def __init__(self):
+        self.regex = re.compile("|".join("(?P<%s>%s)" % s for s in stages))
+        self.tail = ""
+        self.names = [name for name, regex in stages]
+        # index in stages of the last stage reached, -1 if none
+        self.stage = -1
+        # stage name -> time it was reached, in this boot
+        self.times = {}
+        # (offset in console log, time, stage name) of each stage reached
+        self.events = []
+
+    def scan(self, s, offset, now):
+        '''Search chunk s, logged at offset in the console log at time now.'''
+        text = self.tail + s
+        start = offset - len(self.tail)
+        for m in self.regex.finditer(text):
+            # matches within the tail were found with the previous chunk
+            if m.end() <= len(self.tail):
+                continue
+            name = m.lastgroup
+            if name == 'uboot':
+                # a new boot
+                self.times = {}
+            if name not in self.times:
+                self.times[name] = now
+                self.events.append((start + m.start(), now, name))
+            self.stage = self.names.index(name)
+        self.tail = text[-self.carry:]
+
+    def boot_offset(self):
+        '''Offset in the console log of the U-Boot banner of this boot, or 0.'''
+        for offset, t, name in reversed(self.events):
+            if name == 'uboot':
+                return offset
+        return 0
+
+    def name(self):
+        '''Name of the last stage reached, or None.'''
+        return self.names[self.stage] if self.stage >= 0 else None
+
+    def since(self, name):
+        '''Seconds since stage name was reached in this boot, or None.'''
+        if name not in self.times:
+            return None
+        return time.time() - self.times[name]
+
+
+def ubus(board, path, method, timeout=10):
+    '''Return the decoded reply of a ubus call, or None if there is none yet.'''
+    r = board.run("ubus call %s %s" % (path, method), timeout=timeout)
+    if r.status != 0:
+        return None
+    try:
+        # console messages may be mixed with the reply
+        return json.loads(r.output[r.output.index('{'):r.output.rindex('}') + 1])
+    except ValueError:
+        return None
+
+
+def network_up(board, interfaces=('lan', 'wan')):
+    '''True if the interfaces netifd knows of, of those named, are up with an address.'''
+    dump = ubus(board, 'network.interface', 'dump')
+    if dump is None:
+        return False
+    for iface in dump.get('interface', []):
+        if iface.get('interface') not in interfaces:
+            continue
+        if not iface.get('up'):
+            return False
+        if not (iface.get('ipv4-address') or iface.get('ipv6-address')):
+            return False
+    return True
+
+
+def services_running(board):
+    '''True if procd reports every instance of every service running.'''
+    services = ubus(board, 'service', 'list')
+    if services is None:
+        return False
+    for service in services.values():
+        for instance in service.get('instances', {}).values():
+            if not instance.get('running'):
+                return False
+    return True
+
+
+def firewall_loaded(board):
+    '''True if fw3 has set up its chains.'''
+    return board.run("iptables -n -L zone_wan_input >/dev/null 2>&1").status == 0
+
+
+def shell_answers(board, timeout=poll_interval):
+    '''
+    True if the shell shows a prompt within timeout seconds of one empty
+    line. Sending more lines before that would leave prompts behind for
+    later expects to match.
+    '''
+    board.sendline('')
+    try:
+        board.expect(board.prompt, timeout=timeout)
+    except pexpect.TIMEOUT:
+        return False
+    return True
+
+
+ready = {'network': network_up,
+         'services': services_running,
+         'firewall': firewall_loaded}
+
+
+def wait_until(board, state, timeout=60):
+    '''
+    Wait until the board reaches a stage of its boot, or is ready in
+    some way, see above. Raise pexpect.TIMEOUT if it does not within
+    timeout seconds, or an exception if U-Boot comes back.
+    '''
+    deadline = time.time() + timeout
+    names = [name for name, regex in stages]
+    if state in names:
+        patterns = [stages[names.index(state)][1]]
+        # the banner is expected until the kernel starts, after that
+        # it means the board reset
+        kernel = names.index('kernel')
+        if names.index(state) > kernel and board.boot_stages.stage >= kernel:
+            patterns.append(stages[0][1])
+        if board.expect(patterns, timeout=timeout) == 1:
+            raise Exception("U-Boot came back while waiting for %s" % state)
+        return
+    if state == 'prompt':
+        if not shell_answers(board, timeout):
+            raise pexpect.TIMEOUT("Board not ready (%s) within %s seconds" % (state, timeout))
+        return
+    if state not in ready:
+        raise Exception("Unknown boot state %s" % state)
+    while True:
+        try:
+            if ready[state](board):
+                return
+        except Exception as e:
+            # commands may fail while the board is still starting
+            print(e)
+        if time.time() >= deadline:
+            raise pexpect.TIMEOUT("Board not ready (%s) within %s seconds" % (state, timeout))
+        time.sleep(poll_interval)
@@ -7,6 +7,7 @@
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 
 import binascii
+import hashlib
 import os
 import pexpect
 import sys
@@ -57,7 +58,10 @@ def copy_file_to_server(cmd, password):
 
 def download_from_web(url, server, username, password):
     try:
-        urllib2.urlopen(url)
+        # only ask for the headers, the file is downloaded below
+        req = urllib2.Request(url)
+        req.get_method = lambda: 'HEAD'
+        urllib2.urlopen(req, timeout=30)
     except urllib2.HTTPError as e:
         print_bold("HTTP url %s returned %s, exiting" % (url, e.code))
         sys.exit(10)
@@ -76,5 +80,105 @@ def scp_to_tftp_server(fname, server, username, password):
     cmd = "cat %s | ssh -x %s@%s \"tmpfile=\`mktemp /tftpboot/tmp/XXXXX\`; cat - > \$tmpfile; chmod a+rw \$tmpfile; echo \$tmpfile\"" % (fname, username, server)
     return copy_file_to_server(cmd, password)
 
+# Images copied to the tftp server are kept in this directory, named
+# by the sha256 of their content, and reused by later runs.
+tftp_cache = "/tftpboot/cache"
+# Bytes of images to keep there, the least recently used are removed first
+tftp_cache_size = 4 * 1024 * 1024 * 1024
+tftp_cache_stats = {'hit': 0, 'miss': 0}
+# Keys looked up or uploaded by this run, never evicted by it
+tftp_cache_used = set()
+# Files touched that many seconds ago or less may be in use by another run
+tftp_cache_min_age = 10 * 60
+
+def sha256_file(fname):
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def url_cache_key(url):
+    '''
+    Return a key naming the file at url in the tftp cache, made from what
+    the web server says about it, or None if it does not say enough.
+    '''
+    try:
+        req = urllib2.Request(url)
+        req.get_method = lambda: 'HEAD'
+        info = urllib2.urlopen(req, timeout=30).info()
+    except Exception as e:
+        print(e)
+        return None
+    if not info.get('ETag') and not info.get('Last-Modified'):
+        return None
+    desc = "%s %s %s %s" % (url, info.get('ETag'), info.get('Last-Modified'), info.get('Content-Length'))
+    return "url-" + hashlib.sha256(desc).hexdigest()
+
+def tftp_cache_lookup(key, server, username, password):
+    '''Return the name of a cached file on the tftp server, relative to /tftpboot, or None.'''
+    f = "%s/%s" % (tftp_cache, key)
+    # touch it, so the least recently used files are removed first
+    cmd = "ssh -x %s@%s \"[ -s %s ] && touch %s && echo %s || echo NOT_CACHED\"" % (username, server, f, f, f)
+    results = ["/tftpboot/\S+", "NOT_CACHED"]
+    p = pexpect.spawn(command='/bin/bash', args=['-c', cmd], timeout=60)
+    i = p.expect(["yes/no", "password:"] + results)
+    if i == 0:
+        p.sendline("yes")
+        i = p.expect(["not used", "password:"] + results, timeout=45)
+    if i == 1:
+        p.sendline("%s" % password)
+        i = p.expect(["not used", "password:"] + results, timeout=45)
+    name = p.match.group(0).strip()
+    p.close()
+    if i == 2:
+        return name[10:]
+    return None
+
+def cache_to_tftp_server(fname, server, username, password):
+    '''
+    Make a local file or the file at an http(s) url available on the tftp
+    server, uploading it only if it is not cached there already. Return
+    its name relative to /tftpboot.
+    '''
+    web = fname.startswith("http://") or fname.startswith("https://")
+    if web:
+        key = url_cache_key(fname)
+    else:
+        fname = os.path.abspath(fname)
+        if not os.path.isfile(fname):
+            print_bold("File passed as parameter does not exist! Failing!\n")
+            sys.exit(10)
+        key = sha256_file(fname)
+    if key is None:
+        return download_from_web(fname, server, username, password)
+    try:
+        cached = tftp_cache_lookup(key, server, username, password)
+    except Exception as e:
+        print(e)
+        print_bold("Unable to look up %s in tftp cache" % fname)
+        cached = None
+    tftp_cache_used.add(key)
+    tftp_cache_stats['hit' if cached else 'miss'] += 1
+    print_bold("TFTP cache %s for %s (%s hits, %s misses this run)" %
+               ("hit" if cached else "miss", fname, tftp_cache_stats['hit'], tftp_cache_stats['miss']))
+    if cached:
+        return cached
+    if web:
+        source = "curl -L -k %s 2>/dev/null" % fname
+    else:
+        source = "cat %s" % fname
+    # remove least recently used files beyond the size of the cache, but not
+    # the ones this run uses or another run may have just looked up
+    evict = "cd %s; now=\`date +%%s\`; t=0; for f in \`ls -t\`; do t=\$((t+\`stat -c %%s \$f\`)); " \
+            "case \$f in %s) continue;; esac; " \
+            "[ \$((now-\`stat -c %%Y \$f\`)) -lt %d ] && continue; " \
+            "[ \$t -gt %d ] && rm -f \$f; done" % \
+            (tftp_cache, "|".join(sorted(tftp_cache_used)), tftp_cache_min_age, tftp_cache_size)
+    cmd = "%s | ssh -x %s@%s \"mkdir -p %s; tmpfile=\`mktemp %s/.XXXXX\`; cat - > \$tmpfile; chmod a+rw \$tmpfile; " \
+          "mv \$tmpfile %s/%s; %s; echo %s/%s\"" % \
+          (source, username, server, tftp_cache, tftp_cache, tftp_cache, key, evict, tftp_cache, key)
+    return copy_file_to_server(cmd, password)
+
 def print_bold(msg):
     termcolor.cprint(msg, None, attrs=['bold'])
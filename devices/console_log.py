@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Append-only store of everything read from a device.
+
+Consoles of long running tests produce hundreds of MB of output.
+Appending to one string copies the whole log on every read from the
+device, so output is kept as a list of chunks instead, and moved to a
+temporary file once it takes more than max_memory bytes. A log can
+also be streamed to a file as it is read, see stream_to(), so that the
+output is on disk even if bft dies.
+
+The log also keeps an index of (byte offset, seconds since start)
+pairs, written next to the log as "console.log.idx". It is a flat
+array of doubles, so tools can find the output of a time window
+without parsing the log:
+
+  ./devices/console_log.py results/console.log 3200 3300
+  ./devices/console_log.py results/console.log --test iPerfTest
+'''
+
+import array
+import bisect
+import os
+import tempfile
+
+# Bytes of log to keep in memory before moving it to disk
+max_memory = 64 * 1024 * 1024
+
+# Add an index entry at most this often, in seconds
+index_resolution = 0.1
+
+
+class ConsoleLog(object):
+
+    def __init__(self, max_memory=None):
+        if max_memory is None:
+            max_memory = globals()['max_memory']
+        self.max_memory = max_memory
+        self.chunks = []
+        self.chunks_len = 0
+        self.length = 0
+        self.file = None
+        self.offsets = array.array('d')
+        self.times = array.array('d')
+        # when streaming: index file, and size and last time of an
+        # earlier log the stream is appended to
+        self.index_file = None
+        self.base = 0
+        self.time_base = 0
+
+    def append(self, s, ts=None):
+        '''Add output, read ts seconds after the log started.'''
+        if not s:
+            return
+        indexed = ts is not None and (not self.times or ts - self.times[-1] >= index_resolution)
+        if indexed:
+            self.offsets.append(self.length)
+            self.times.append(ts)
+        self.chunks.append(s)
+        self.chunks_len += len(s)
+        self.length += len(s)
+        if self.index_file is not None:
+            self.file.write(s)
+            if indexed:
+                array.array('d', [self.base + self.length - len(s), self.time_base + ts]).tofile(self.index_file)
+                self.flush()
+        if self.chunks_len > self.max_memory:
+            self.spill()
+
+    def spill(self):
+        '''Move chunks in memory to the end of the file on disk.'''
+        if self.index_file is not None:
+            # already written as they were read
+            self.flush()
+        else:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(prefix='bft-console-')
+            self.file.seek(0, 2)
+            for c in self.chunks:
+                self.file.write(c)
+            self.file.flush()
+        self.chunks = []
+        self.chunks_len = 0
+
+    def stream_to(self, fname):
+        '''
+        From now on write the log to file fname as it is read, and its
+        index to fname + ".idx". Both are appended to, after what an
+        earlier run wrote there; offsets in the file are len(fname) at
+        this point plus offsets in this log.
+        '''
+        f = open(fname, 'a+b')
+        f.seek(0, 2)
+        base = f.tell()
+        time_base = 0
+        if os.path.exists(fname + '.idx'):
+            times = read_index(fname + '.idx')[1]
+            time_base = times[-1] if times else 0
+        self.write_to(f)
+        index_file = open(fname + '.idx', 'ab')
+        self.write_index(index_file, base=base, time_base=time_base)
+        if self.file is not None:
+            self.file.close()
+        self.base = base
+        self.time_base = time_base
+        self.file = f
+        self.index_file = index_file
+        self.chunks = []
+        self.chunks_len = 0
+        self.flush()
+
+    def flush(self):
+        '''Make sure what is streamed so far is on disk.'''
+        if self.index_file is not None:
+            self.file.flush()
+            self.index_file.flush()
+
+    def __len__(self):
+        return self.length
+
+    def __nonzero__(self):
+        return True
+    __bool__ = __nonzero__
+
+    def endswith(self, suffix):
+        if self.chunks and len(self.chunks[-1]) >= len(suffix):
+            return self.chunks[-1].endswith(suffix)
+        return self.read(max(0, self.length - len(suffix))).endswith(suffix)
+
+    def read(self, start=0, end=None):
+        '''Return part of the log, as a string.'''
+        if end is None or end > self.length:
+            end = self.length
+        if start >= end:
+            return ""
+        parts = []
+        on_disk = self.length - self.chunks_len
+        if start < on_disk:
+            self.file.seek(self.base + start)
+            parts.append(self.file.read(min(end, on_disk) - start))
+        if end > on_disk:
+            # join chunks in memory, so later reads are cheap
+            if len(self.chunks) > 1:
+                self.chunks = ["".join(self.chunks)]
+            parts.append(self.chunks[0][max(0, start - on_disk):end - on_disk])
+        return "".join(parts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, end, step = i.indices(self.length)
+            return self.read(start, end)[::step]
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("console log index out of range")
+        return self.read(i, i + 1)
+
+    def __str__(self):
+        return self.read()
+
+    def __repr__(self):
+        return "<console log, %s bytes>" % self.length
+
+    def write_to(self, f, start=0, block=1024 * 1024):
+        '''Write the log to file f, a block at a time.'''
+        for pos in range(start, self.length, block):
+            f.write(self.read(pos, pos + block))
+
+    def offset_at(self, ts):
+        '''Return offset of the first output read at or after ts seconds.'''
+        i = bisect.bisect_left(self.times, ts)
+        if i >= len(self.offsets):
+            return self.length
+        return int(self.offsets[i])
+
+    def time_at(self, offset):
+        '''Return seconds since start at which output at offset was read, or None.'''
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        if i < 0:
+            return None
+        return self.times[i]
+
+    def window(self, start, end):
+        '''Return output read between start and end seconds.'''
+        return self.read(self.offset_at(start), self.offset_at(end))
+
+    def write_index(self, f, base=0, time_base=0):
+        '''
+        Write the index to file f, offsets moved by base bytes and times
+        by time_base seconds, e.g. when appending to an earlier log.
+        '''
+        index = array.array('d')
+        for o, t in zip(self.offsets, self.times):
+            index.append(o + base)
+            index.append(t + time_base)
+        index.tofile(f)
+
+
+def read_index(fname):
+    '''Return offsets and times of a "console.log.idx" file, as two lists.'''
+    index = array.array('d')
+    with open(fname, 'rb') as f:
+        index.fromstring(f.read())
+    return [int(o) for o in index[0::2]], list(index[1::2])
+
+
+def read_window(log_name, start, end):
+    '''Return output of a console log file read between start and end seconds.'''
+    offsets, times = read_index(log_name + '.idx')
+    def offset_at(ts):
+        i = bisect.bisect_left(times, ts)
+        if i >= len(offsets):
+            return os.path.getsize(log_name)
+        return offsets[i]
+    return read_range(log_name, offset_at(start), offset_at(end))
+
+
+def read_range(log_name, start, end):
+    '''Return bytes start to end of a console log file.'''
+    with open(log_name, 'rb') as f:
+        f.seek(start)
+        return f.read(max(0, end - start))
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+    parser = argparse.ArgumentParser(description='Show part of a console log written by bft.')
+    parser.add_argument('log', help='console.log file, with its .idx file next to it')
+    parser.add_argument('start', nargs='?', type=float, help='seconds since start of log')
+    parser.add_argument('end', nargs='?', type=float, help='seconds since start of log')
+    parser.add_argument('--test', help='show output during this test, from test_results.jsonl')
+    args = parser.parse_args()
+
+    if args.test:
+        records = os.path.join(os.path.dirname(args.log), 'test_results.jsonl')
+        found = False
+        for line in open(records):
+            r = json.loads(line)
+            if r['name'] == args.test and r.get('console_start') is not None:
+                sys.stdout.write(read_range(args.log, r['console_start'], r['console_end']))
+                found = True
+        if not found:
+            print("No console output recorded for %s" % args.test)
+            sys.exit(1)
+    else:
+        start = args.start or 0
+        end = args.end if args.end is not None else float('inf')
+        sys.stdout.write(read_window(args.log, start, end))
@@ -5,20 +5,29 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import json
+import os
+import pipes
 import sys
 import time
 import pexpect
 import base
+import session_broker
+import prompts
+import transfer
 
 from termcolor import colored, cprint
 
+# Serve tftp with devices/tftp_server.py instead of tftpd-hpa, set by bft
+builtin_tftp_server = False
+
 
 class DebianBox(base.BaseDevice):
     '''
     A linux machine running an ssh server.
     '''
 
-    prompt = ['root\\@.*:.*#', '/ # ', ".*:~ #" ]
+    prompt = prompts.Prompt(['root\\@.*:.*#', '/ # ', ".*:~ #" ])
 
     def __init__(self,
                  name,
@@ -31,12 +40,12 @@ class DebianBox(base.BaseDevice):
                  location=None):
         if name is None:
             return
-        pexpect.spawn.__init__(self,
-                               command="ssh",
-                               args=['%s@%s' % (username, name),
-                                     '-p', port,
-                                     '-o', 'StrictHostKeyChecking=no',
-                                     '-o', 'UserKnownHostsFile=/dev/null'])
+        command, args = session_broker.command("ssh",
+                                               ['%s@%s' % (username, name),
+                                                '-p', port,
+                                                '-o', 'StrictHostKeyChecking=no',
+                                                '-o', 'UserKnownHostsFile=/dev/null'])
+        pexpect.spawn.__init__(self, command=command, args=args)
         self.name = name
         self.color = color
         self.output = output
@@ -46,7 +55,7 @@ class DebianBox(base.BaseDevice):
         self.location = location
         cprint("%s device console = %s" % (name, colored(color, color)), None, attrs=['bold'])
         try:
-            i = self.expect(["yes/no", "assword:", "Last login"], timeout=30)
+            i = self.expect(["yes/no", "assword:", "Last login", session_broker.resumed], timeout=30)
         except pexpect.TIMEOUT as e:
             raise Exception("Unable to connect to %s." % name)
         except pexpect.EOF as e:
@@ -58,6 +67,9 @@ class DebianBox(base.BaseDevice):
             i = self.expect(["Last login", "assword:"])
         if i == 1:
             self.sendline(password)
+        elif i == 3:
+            # already logged in, session was kept open by the broker
+            self.sendline()
         else:
             pass
         self.expect(self.prompt)
@@ -99,9 +111,7 @@ class DebianBox(base.BaseDevice):
         return ipaddr
 
     def ip_neigh_flush(self):
-        self.sendline('\nip -s neigh flush all')
-        self.expect('flush all')
-        self.expect(self.prompt)
+        self.run('ip -s neigh flush all')
 
     def turn_on_pppoe(self):
         self.sendline('apt-get -o Dpkg::Options::="--force-confnew" -y install pppoe')
@@ -120,10 +130,58 @@ class DebianBox(base.BaseDevice):
         self.expect("pppd")
         self.expect(self.prompt)
 
+    # where tftp_server.py runs on this device, and writes its stats
+    tftp_server_script = '/tmp/bft_tftp_server.py'
+    tftp_server_pid = '/tmp/bft_tftp_server.pid'
+    tftp_stats_file = '/tmp/bft_tftp_stats.jsonl'
+
     def restart_tftp_server(self):
-        self.sendline('\n/etc/init.d/tftpd-hpa restart')
-        self.expect('Restarting')
-        self.expect(self.prompt)
+        if builtin_tftp_server:
+            self.start_tftp_server()
+            return
+        self.run('/etc/init.d/tftpd-hpa restart', check=True)
+
+    def start_tftp_server(self):
+        '''
+        Serve /srv/tftp with devices/tftp_server.py instead of tftpd-hpa.
+        Return False if it did not start, tftpd-hpa is started again then.
+        '''
+        local = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tftp_server.py')
+        transfer.host_ssh(self, "cat > %s" % self.tftp_server_script, before="cat %s |" % pipes.quote(local))
+        self.run_batch(['/etc/init.d/tftpd-hpa stop',
+                        'kill `cat %s` 2>/dev/null' % self.tftp_server_pid], check=False)
+        self.run_batch(['nohup `command -v python3 || command -v python` %s --root /srv/tftp --stats %s '
+                        '> /tmp/bft_tftp_server.log 2>&1 &' % (self.tftp_server_script, self.tftp_stats_file),
+                        'echo $! > %s' % self.tftp_server_pid])
+        # it exits at once if python is missing or port 69 is taken
+        for i in range(5):
+            time.sleep(1)
+            r = self.run('kill -0 `cat %s` && (ss -uln 2>/dev/null || netstat -uln) | grep -q ":69 "'
+                         % self.tftp_server_pid)
+            if r.status == 0:
+                return True
+        self.run('cat /tmp/bft_tftp_server.log')
+        cprint("Unable to start tftp_server.py on %s, using tftpd-hpa instead." % self.name,
+               None, attrs=['bold'])
+        self.run_batch(['kill `cat %s` 2>/dev/null' % self.tftp_server_pid,
+                        '/etc/init.d/tftpd-hpa start'], check=False)
+        return False
+
+    def tftp_stats(self):
+        '''
+        Return stats of each transfer done by tftp_server.py since the
+        last call, as dicts, see tftp_server.py.
+        '''
+        if not builtin_tftp_server:
+            return []
+        r = self.run("cat %s 2>/dev/null; rm -f %s" % (self.tftp_stats_file, self.tftp_stats_file))
+        stats = []
+        for line in r.output.splitlines():
+            try:
+                stats.append(json.loads(line))
+            except ValueError:
+                pass
+        return stats
 
     def configure(self, kind):
         if kind == "wan_device":
@@ -184,40 +242,26 @@ class DebianBox(base.BaseDevice):
         self.expect(self.prompt)
 
         #configure tftp server
-        self.sendline('/etc/init.d/tftpd-hpa stop')
-        self.expect('Stopping')
-        self.expect(self.prompt)
-        self.sendline('rm -rf /tftpboot')
-        self.expect(self.prompt)
-        self.sendline('rm -rf /srv/tftp')
-        self.expect(self.prompt)
-        self.sendline('mkdir -p /srv/tftp')
-        self.expect(self.prompt)
-        self.sendline('ln -sf /srv/tftp/ /tftpboot')
-        self.expect(self.prompt)
-        self.sendline('mkdir -p /tftpboot/tmp')
-        self.expect(self.prompt)
-        self.sendline('chmod a+w /tftpboot/tmp')
-        self.expect(self.prompt)
-        self.sendline('mkdir -p /tftpboot/crashdump')
-        self.expect(self.prompt)
-        self.sendline('chmod a+w /tftpboot/crashdump')
-        self.expect(self.prompt)
-        self.sendline('sed /TFTP_OPTIONS/d -i /etc/default/tftpd-hpa')
-        self.expect(self.prompt)
-        self.sendline('echo TFTP_OPTIONS=\\"-4 --secure --create\\" >> /etc/default/tftpd-hpa')
-        self.expect(self.prompt)
-        self.sendline('sed /TFTP_DIRECTORY/d -i /etc/default/tftpd-hpa')
-        self.expect(self.prompt)
-        self.sendline('echo TFTP_DIRECTORY=\\"/srv/tftp\\" >> /etc/default/tftpd-hpa')
-        self.expect(self.prompt)
-        self.sendline('/etc/init.d/tftpd-hpa restart')
-        self.expect(self.prompt)
-
-        self.sendline('echo 0 > /proc/sys/net/ipv4/tcp_timestamps')
-        self.expect(self.prompt)
-        self.sendline('echo 0 > /proc/sys/net/ipv4/tcp_sack')
-        self.expect(self.prompt)
+        self.run_batch(['/etc/init.d/tftpd-hpa stop',
+                        'rm -rf /tftpboot',
+                        # keep images cached by earlier runs
+                        'find /srv/tftp -mindepth 1 -maxdepth 1 ! -name cache -exec rm -rf {} +',
+                        'mkdir -p /srv/tftp',
+                        'ln -sf /srv/tftp/ /tftpboot',
+                        'mkdir -p /tftpboot/tmp',
+                        'chmod a+w /tftpboot/tmp',
+                        'mkdir -p /tftpboot/crashdump',
+                        'chmod a+w /tftpboot/crashdump',
+                        'mkdir -p /tftpboot/cache',
+                        'sed /TFTP_OPTIONS/d -i /etc/default/tftpd-hpa',
+                        'echo TFTP_OPTIONS=\\"-4 --secure --create\\" >> /etc/default/tftpd-hpa',
+                        'sed /TFTP_DIRECTORY/d -i /etc/default/tftpd-hpa',
+                        'echo TFTP_DIRECTORY=\\"/srv/tftp\\" >> /etc/default/tftpd-hpa',
+                        '/etc/init.d/tftpd-hpa restart',
+                        'echo 0 > /proc/sys/net/ipv4/tcp_timestamps',
+                        'echo 0 > /proc/sys/net/ipv4/tcp_sack'], check=False)
+        if builtin_tftp_server:
+            self.start_tftp_server()
 
         self.sendline('ifconfig eth1')
         self.expect(self.prompt)
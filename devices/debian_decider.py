@@ -1,7 +1,17 @@
-import debian
-import non_root_debian
+from debian import DebianBox
+from non_root_debian import NonRootDebianBox
 import sys
 
+def debian_class(username):
+    '''
+    This function controls which class to use for your debian boxes: DebianBox
+    when your username is root and NotRootDebianBox for other usernames.
+    '''
+    if (username is 'root'):
+        return DebianBox
+    else:
+        return NonRootDebianBox
+
 def debian(name, color,
                     username,
                     password,
@@ -10,14 +20,9 @@ def debian(name, color,
                     reboot=False,
                     location=None):
     '''
-    This function controls which class to use for your debian boxes: DebianBox
-    when your username is root and NotRootDebianBox for other usernames.
+    Connect to a debian box, using the class picked by debian_class().
     '''
-    if (username is 'root'):
-        return debian.DebianBox(name=name, color=color, username=username,
-                                password=password, port=port, output=output,
-                                reboot=reboot, location=location)
-    else:
-        return non_root_debian.NonRootDebianBox(name=name, color=color, username=username,
-                                                password=password, port=port, output=output,
-                                                reboot=reboot, location=location)
+    cls = debian_class(username)
+    return cls(name=name, color=color, username=username,
+               password=password, port=port, output=output,
+               reboot=reboot, location=location)
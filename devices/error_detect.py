@@ -8,12 +8,56 @@
 import pexpect
 import common
 import re
-import inspect
 import os
+import sys
 
 # Add this to your env if you need to disable this for some reason
 BFT_DISABLE_ERROR_DETECT = "BFT_DISABLE_ERROR_DETECT" in os.environ
 
+# Console output that signals trouble: (name, regular expression).
+# Matches must not span lines, and be shorter than Scanner.carry.
+signatures = [('crashdump', 'Crashdump magic found'),
+              ('kernel_panic', 'Kernel panic - not syncing'),
+              ('oops', 'Oops(\[#\d+\])?: '),
+              ('oom', 'invoked oom-killer'),
+              ('watchdog', 'Resetting with watch dog|soft lockup'),
+              ('uboot', 'U-Boot \d{4}\.\d\d')]
+
+
+class Scanner(object):
+    '''
+    Finds signatures in console output as it is logged. All signatures
+    are searched in one pass of one regular expression over each new
+    chunk, plus the end of the previous chunk, so a signature split
+    between two reads is still found, and found only once.
+    '''
+
+    # Bytes of the previous chunk searched again
+    carry = 64
+
+    def __init__(self):
+        self.regex = re.compile("|".join("(?P<%s>%s)" % s for s in signatures))
+        self.tail = ""
+        # (offset in console log, name, text) of each signature found
+        self.events = []
+        self.handled = 0
+
+    def scan(self, s, offset):
+        '''Search chunk s, logged at offset in the console log.'''
+        text = self.tail + s
+        start = offset - len(self.tail)
+        for m in self.regex.finditer(text):
+            # matches within the tail were found with the previous chunk
+            if m.end() > len(self.tail):
+                self.events.append((start + m.start(), m.lastgroup, m.group()))
+        self.tail = text[-self.carry:]
+
+    def new_events(self):
+        '''Return events not returned before.'''
+        events = self.events[self.handled:]
+        self.handled = len(self.events)
+        return events
+
 def detect_kernel_panic(console, s):
     if re.findall("Kernel panic - not syncing", s):
         console.close()
@@ -56,25 +100,31 @@ def detect_fatal_error(console):
     if BFT_DISABLE_ERROR_DETECT:
         return
 
-    s = ""
-
-    if isinstance(console.before, str):
-        s += console.before
-    if isinstance(console.after, str):
-        s += console.after
-
-    detect_crashdump_error(console, s)
-    #detect_kernel_panic(console, s)
+    # output was scanned as it was logged, see Scanner
+    scanner = getattr(console.logfile_read, 'scanner', None)
+    if scanner is None:
+        return
+    # events of earlier boots are stale, e.g. found while Linux was down
+    stages = getattr(console.logfile_read, 'stages', None)
+    boot_offset = stages.boot_offset() if stages is not None else 0
+    for offset, name, text in scanner.new_events():
+        if offset < boot_offset:
+            continue
+        common.print_bold("Found '%s' at offset %s of console log" % (text, offset))
+        if name == 'crashdump':
+            detect_crashdump_error(console, text)
+        #elif name == 'kernel_panic':
+        #    detect_kernel_panic(console, text)
 
 def caller_file_line(i):
-    caller = inspect.stack()[i] # caller of spawn or pexpect
-    frame = caller[0]
-    info = inspect.getframeinfo(frame)
+    # inspect.stack() reads the source of every frame, which is slow
+    frame = sys._getframe(i) # caller of spawn or pexpect
+    code = frame.f_code
 
     # readline calls expect
-    if info.function == "readline":
+    if code.co_name == "readline":
         # note: we are calling ourselves, so we have to add more than 1 here
         return caller_file_line(i+2)
-    return "%s: %s(): line %s" % (info.filename, info.function, info.lineno)
+    return "%s: %s(): line %s" % (code.co_filename, code.co_name, frame.f_lineno)
 
 
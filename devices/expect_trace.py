@@ -0,0 +1,157 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Record how long tests wait on devices.
+
+Every expect() of a device is recorded: the line it was called from,
+the pattern, seconds waited and bytes of output consumed. The last
+events are kept in arrays allocated once, and a histogram of wait
+times is kept per call site and per test, so recording costs a few
+array writes. At the end of a run, bft writes them to
+"expect_trace.txt":
+
+  Per test:
+    iPerfTest                     312 expects      75.2 s waited
+      <1ms: 130  <2ms: 41 ... <64s: 1
+  Per call site, longest total wait first:
+    tests/iperf_test.py:58 parse_iperf() 'Bytes([^M]*)Mbits'
+      5 expects 70.1 s waited, max 69.8 s
+      ...
+'''
+
+import array
+import math
+import os
+import sys
+import time
+
+import pexpect
+
+enabled = True
+
+# Number of most recent expects kept
+size = 65536
+
+# Histogram buckets: under 1 ms, then under 2, 4, 8, ... ms
+buckets = 24
+
+# Name of the test running, set by the test runner
+test = None
+
+_skip = os.path.dirname(os.path.abspath(pexpect.__file__))
+
+count = 0
+ev_time = array.array('d', [0.0]) * size
+ev_wait = array.array('d', [0.0]) * size
+ev_bytes = array.array('l', [0]) * size
+ev_site = array.array('l', [0]) * size
+ev_test = array.array('l', [0]) * size
+
+# call site -> number, and their names
+site_numbers = {}
+sites = []
+# test name -> number, and their names
+test_numbers = {}
+tests = []
+# [count, total wait, max wait, histogram] per site and per test
+site_stats = []
+test_stats = []
+
+
+def _stats():
+    return [0, 0.0, 0.0, array.array('l', [0]) * buckets]
+
+
+def _add(stats, wait, bucket):
+    stats[0] += 1
+    stats[1] += wait
+    if wait > stats[2]:
+        stats[2] = wait
+    stats[3][bucket] += 1
+
+
+def caller(depth=1):
+    '''Return the frame that called expect(), skipping wrappers of it and pexpect.'''
+    f = sys._getframe(depth + 1)
+    while f.f_back is not None and (f.f_code.co_name in ('expect', 'expect_task') or
+                                    f.f_code.co_filename.startswith(_skip)):
+        f = f.f_back
+    return f
+
+
+def record(device, pattern, start, frame=None):
+    '''
+    Record an expect() of device that started at time start, called
+    from frame, by default the caller.
+    '''
+    global count
+    if not enabled:
+        return
+    now = time.time()
+    wait = now - start
+    f = frame if frame is not None else caller(1)
+    key = (f.f_code.co_filename, f.f_lineno)
+    site = site_numbers.get(key)
+    if site is None:
+        site = site_numbers[key] = len(sites)
+        p = getattr(pattern, 'pattern', pattern)
+        sites.append("%s:%s %s() %.60r" % (os.path.relpath(key[0]), key[1], f.f_code.co_name, p))
+        site_stats.append(_stats())
+    t = test_numbers.get(test)
+    if t is None:
+        t = test_numbers[test] = len(tests)
+        tests.append(test)
+        test_stats.append(_stats())
+    nbytes = 0
+    if isinstance(device.before, str):
+        nbytes += len(device.before)
+    if isinstance(device.after, str):
+        nbytes += len(device.after)
+    # bucket n holds waits of 2**(n-1) to 2**n ms
+    bucket = 0
+    if wait >= 0.001:
+        bucket = min(buckets - 1, math.frexp(wait * 1000)[1])
+    i = count % size
+    ev_time[i] = start
+    ev_wait[i] = wait
+    ev_bytes[i] = nbytes
+    ev_site[i] = site
+    ev_test[i] = t
+    count += 1
+    _add(site_stats[site], wait, bucket)
+    _add(test_stats[t], wait, bucket)
+
+
+def events():
+    '''Return the expects still kept, oldest first, as (start, wait, bytes, site, test).'''
+    first = max(0, count - size)
+    return [(ev_time[n % size], ev_wait[n % size], ev_bytes[n % size],
+             sites[ev_site[n % size]], tests[ev_test[n % size]]) for n in range(first, count)]
+
+
+def histogram(h):
+    # 1024 ms is shown as 1s, and so on
+    labels = ["<1ms"] + ["<%sms" % 2 ** n if n < 10 else "<%ss" % 2 ** (n - 10)
+                         for n in range(1, buckets)]
+    return "  ".join("%s: %s" % (labels[n], c) for n, c in enumerate(h) if c)
+
+
+def write_report(f, slowest=20):
+    '''Write histograms of waits per test and per call site to file f.'''
+    f.write("Per test:\n")
+    for name, s in zip(tests, test_stats):
+        f.write("  %-40s %6d expects %9.2f s waited\n" % (name, s[0], s[1]))
+        f.write("    %s\n" % histogram(s[3]))
+    f.write("\nPer call site, longest total wait first:\n")
+    for s, name in sorted(zip(site_stats, sites), key=lambda x: -x[0][1]):
+        f.write("  %s\n" % name)
+        f.write("    %d expects %.2f s waited, max %.2f s\n" % (s[0], s[1], s[2]))
+        f.write("    %s\n" % histogram(s[3]))
+    f.write("\nLongest waits of the last %s expects:\n" % min(count, size))
+    for start, wait, nbytes, site, t in sorted(events(), key=lambda e: -e[1])[:slowest]:
+        f.write("  %8.2f s %8d bytes  %s: %s\n" % (wait, nbytes, t, site))
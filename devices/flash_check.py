@@ -0,0 +1,207 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Compare images in flash with the images to flash, using crc32.
+
+The crc32 of the local copy of an image is computed once, and U-Boot
+computes the crc32 of the flash region, so no image is ever compared
+byte by byte over the console. This is used twice:
+
+  1. Before a partition is flashed, to skip it if it already holds the
+     image:
+
+       if board.flash_unchanged('rootfs', ROOTFS, self.rootfs_addr, read='nand'):
+           return
+       start = time.time()
+       ... tftp, erase, write ...
+       board.flash_done('rootfs', start)
+
+     How long flashing each partition took is remembered for each type
+     of board, so that the time saved by skipping it can be recorded.
+
+  2. After a partition is flashed, to check it was written correctly:
+
+       board.flash_verify('rootfs', ROOTFS, self.rootfs_addr, read='nand')
+
+     which returns a Verification, or raises an exception on mismatch.
+'''
+
+import binascii
+import os
+import time
+
+import common
+import staging
+
+# Remembers how many seconds flashing each partition takes, a
+# timings.TestTimings set by bft. Nothing is remembered if None.
+timings = None
+
+# local file -> (mtime, size, crc32)
+_crcs = {}
+
+
+def crc32_file(fname):
+    '''Return (size, crc32) of a local file.'''
+    st = os.stat(fname)
+    known = _crcs.get(fname)
+    if known is not None and known[:2] == (st.st_mtime, st.st_size):
+        return known[1:]
+    crc = 0
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            crc = binascii.crc32(block, crc)
+    _crcs[fname] = (st.st_mtime, st.st_size, crc & 0xffffffff)
+    return _crcs[fname][1:]
+
+
+def uboot_crc32(board, addr, size, timeout=60):
+    '''
+    Return (size, crc32) U-Boot computes of size bytes of memory at addr,
+    or None if this U-Boot has no crc32 command. addr and size may be
+    U-Boot variables, like $fileaddr and $filesize.
+    '''
+    if isinstance(size, (int, long)):
+        size = hex(size)
+    board.sendline('crc32 %s %s' % (addr, size))
+    i = board.expect(['([0-9a-fA-F]+) \.\.\. ([0-9a-fA-F]+) ==> ([0-9a-fA-F]{8})', 'Unknown command'],
+                     timeout=timeout)
+    ret = None
+    if i == 0:
+        first, last, crc = [int(x, 16) for x in board.match.groups()]
+        ret = (last - first + 1, crc)
+    board.expect(board.uprompt)
+    return ret
+
+
+def read_to_ram(board, read, addr, size, ram):
+    '''Copy size bytes of flash at addr to ram, for nand or spi flash.'''
+    if read == 'nand':
+        # whole blocks, so bad blocks are skipped properly
+        block = getattr(board, 'flash_block_size', 0x20000)
+        size = ((size - 1) // block + 1) * block
+        board.sendline('nand read %s %s %s' % (ram, addr, hex(size)))
+        board.expect('OK', timeout=90)
+        board.expect(board.uprompt)
+    elif read == 'sf':
+        board.sendline('sf probe')
+        board.expect('SF: Detected')
+        board.expect(board.uprompt)
+        board.sendline('sf read %s %s %s' % (ram, addr, hex(size)))
+        board.expect(board.uprompt, timeout=90)
+    else:
+        raise Exception("Unknown kind of flash %s" % read)
+
+
+def flash_crc32(board, addr, size, read=None, ram=None):
+    '''
+    Return the crc32 of size bytes of flash at addr, or None if U-Boot
+    cannot compute it. NOR flash mapped in memory is checked in place,
+    nand or spi flash (read set to 'nand' or 'sf') is copied first to ram.
+    '''
+    if read is not None:
+        read_to_ram(board, read, addr, size, ram)
+        addr = ram
+    ret = uboot_crc32(board, addr, size)
+    return ret[1] if ret is not None else None
+
+
+def flash_unchanged(board, name, fname, addr, read=None, ram=None):
+    '''
+    Return True if flash at addr already holds image fname, see
+    flash_crc32() for read and ram, ram being the address the image
+    would be loaded to.
+    '''
+    if addr is None:
+        return False
+    try:
+        size, crc = crc32_file(staging.local_name(fname))
+        if size == 0:
+            return False
+        flashed = flash_crc32(board, addr, size, read=read, ram=ram)
+    except Exception as e:
+        print(e)
+        common.print_bold("Unable to compare %s with the image in flash" % name)
+        board.sendcontrol('c')
+        board.expect(board.uprompt)
+        return False
+    if flashed != crc:
+        return False
+    saved = 0
+    if timings is not None:
+        saved = timings.get(board.model, name, 0)
+    board.flash_time_saved += saved
+    common.print_bold("%s in flash is unchanged, not flashing it (saved %.0f s)" % (name, saved))
+    return True
+
+
+def flash_done(board, name, start):
+    '''Remember how long flashing partition name took, since time start.'''
+    seconds = time.time() - start
+    common.print_bold("Flashed %s in %.0f s" % (name, seconds))
+    if timings is None:
+        return
+    try:
+        timings.update(board.model, [(name, seconds)])
+    except Exception as e:
+        print(e)
+        common.print_bold("Unable to store flash timings.")
+
+
+class Verification(object):
+    '''Result of checking a partition after flashing it: true if it holds the image.'''
+
+    def __init__(self, name, addr, size, expected, flashed, duration):
+        self.name = name
+        self.addr = addr
+        self.size = size
+        self.expected = expected
+        self.flashed = flashed
+        self.duration = duration
+
+    def __nonzero__(self):
+        return self.flashed is not None and self.flashed == self.expected
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        flashed = "%08x" % self.flashed if self.flashed is not None else "unknown"
+        return "<%s at %s: %s bytes, crc32 %08x, flashed %s, checked in %.1fs>" % \
+            (self.name, self.addr, self.size, self.expected, flashed, self.duration)
+
+
+def verify(board, name, fname, addr, read=None, ram=None):
+    '''
+    Check that flash at addr holds image fname, see flash_crc32() for
+    read and ram. Without fname, the image loaded in U-Boot at $fileaddr
+    is used instead. Return a Verification, or raise an exception if the
+    flash does not hold the image.
+    '''
+    start = time.time()
+    if fname is not None:
+        size, expected = crc32_file(staging.local_name(fname))
+    else:
+        loaded = uboot_crc32(board, '$fileaddr', '$filesize')
+        if loaded is None:
+            raise Exception("U-Boot has no crc32 command, unable to verify %s" % name)
+        size, expected = loaded
+    flashed = flash_crc32(board, addr, size, read=read, ram=ram)
+    if flashed is None and read is None:
+        # without crc32, compare with the image still loaded in memory
+        board.sendline('cmp.b $fileaddr %s %s' % (addr, hex(size)))
+        i = board.expect(['Total of %s byte' % size, 'Total of \d+ byte'], timeout=180)
+        board.expect(board.uprompt)
+        flashed = expected if i == 0 else expected ^ 0xffffffff
+    ret = Verification(name, addr, size, expected, flashed, time.time() - start)
+    board.flash_verifications.append(ret)
+    if flashed is None:
+        common.print_bold("Unable to verify %r, U-Boot has no crc32 command" % ret)
+    elif not ret:
+        raise Exception("Verification of flashed %r failed" % ret)
+    else:
+        common.print_bold("Verified %r" % ret)
+    return ret
@@ -1,12 +1,13 @@
 import base
 import pexpect
 import debian
+import prompts
 import sys
 import argparse
 from termcolor import colored, cprint
 
 class LocalDebianRunner(debian.DebianBox):
-    prompt = ['root\\@.*:.*#', '/ # ', ".*:~ #", ".*:~.*\\$", ".*\\@.*:.*\\$" ]
+    prompt = prompts.Prompt(['root\\@.*:.*#', '/ # ', ".*:~ #", ".*:~.*\\$", ".*\\@.*:.*\\$" ])
 
     def __init__(self,
                  color,
@@ -1,4 +1,5 @@
 import pexpect
+import session_broker
 
 class LocalSerialConnection():
     '''
@@ -11,13 +12,14 @@ class LocalSerialConnection():
         self.conn_cmd = conn_cmd
 
     def connect(self):
+        command, args = session_broker.command('/bin/bash', ['-c', self.conn_cmd])
         pexpect.spawn.__init__(self.device,
-                           command='/bin/bash',
-                           args=['-c', self.conn_cmd])
+                           command=command,
+                           args=args)
         try:
-            result = self.device.expect(".*Connected.*")
+            result = self.device.expect([".*Connected.*", session_broker.resumed])
         except pexpect.EOF as e:
             raise Exception("Board is in use (connection refused).")
 
-    def close():
+    def close(self):
         self.device.sendline("~.")
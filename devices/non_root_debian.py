@@ -9,6 +9,8 @@ import sys
 import time
 import pexpect
 import base
+import session_broker
+import prompts
 import argparse
 
 from termcolor import colored, cprint
@@ -24,7 +26,7 @@ class NonRootDebianBox(base.BaseDevice):
     This requires a copy of Boardfarm on your debian box.
     '''
 
-    prompt = ['root\\@.*:.*#', '/ # ', ".*:~ #", ".*:~.*\\$", ".*\\@.*:.*\\$" ]
+    prompt = prompts.Prompt(['root\\@.*:.*#', '/ # ', ".*:~ #", ".*:~.*\\$", ".*\\@.*:.*\\$" ])
 
     def __init__(self,
                  name,
@@ -38,12 +40,12 @@ class NonRootDebianBox(base.BaseDevice):
                  ):
         if name is None:
             return
-        pexpect.spawn.__init__(self,
-                               command="ssh",
-                               args=['%s@%s' % (username, name),
-                                     '-p', port,
-                                     '-o', 'StrictHostKeyChecking=no',
-                                     '-o', 'UserKnownHostsFile=/dev/null'])
+        command, args = session_broker.command("ssh",
+                                               ['%s@%s' % (username, name),
+                                                '-p', port,
+                                                '-o', 'StrictHostKeyChecking=no',
+                                                '-o', 'UserKnownHostsFile=/dev/null'])
+        pexpect.spawn.__init__(self, command=command, args=args)
         self.name = name
         self.color = color
         self.output = output
@@ -53,7 +55,7 @@ class NonRootDebianBox(base.BaseDevice):
         self.location = location
         cprint("%s device console = %s" % (name, colored(color, color)), None, attrs=['bold'])
         try:
-            i = self.expect(["yes/no", "assword:", "Last login"], timeout=30)
+            i = self.expect(["yes/no", "assword:", "Last login", session_broker.resumed], timeout=30)
         except pexpect.TIMEOUT as e:
             raise Exception("Unable to connect to %s." % name)
         except pexpect.EOF as e:
@@ -65,6 +67,9 @@ class NonRootDebianBox(base.BaseDevice):
             i = self.expect(["Last login", "assword:"])
         if i == 1:
             self.sendline(password)
+        elif i == 3:
+            # already logged in, session was kept open by the broker
+            self.sendline()
         else:
             pass
         self.expect(self.prompt)
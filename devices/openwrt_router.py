@@ -15,18 +15,28 @@ import sys
 import urllib2
 import pexpect
 import base
+import boot_stages
 from datetime import datetime
 import time
 
 import error_detect
+import flash_check
 import power
 import common
 import connection_decider
+import prompts
+import staging
+import transfer
 
 
 # To Do: maybe make this config variable
 BFT_DEBUG = "BFT_DEBUG" in os.environ
 
+# tftp options U-Boot asks for, set by bft when devices/tftp_server.py
+# serves images. None keeps the U-Boot defaults.
+tftp_blocksize = None
+tftp_windowsize = None
+
 
 class OpenWrtRouter(base.BaseDevice):
     '''
@@ -37,8 +47,8 @@ class OpenWrtRouter(base.BaseDevice):
       power_outlet: Outlet # this device is connected
     '''
 
-    prompt = ['root\\@.*:.*#', '/ # ', '@R7500:/# ']
-    uprompt = ['ath>', '\(IPQ\) #', 'ar7240>', '\(IPQ40xx\)']
+    prompt = prompts.Prompt(['root\\@.*:.*#', '/ # ', '@R7500:/# '])
+    uprompt = prompts.Prompt(['ath>', '\(IPQ\) #', 'ar7240>', '\(IPQ40xx\)'])
     linux_booted = False
 
     def __init__(self,
@@ -62,6 +72,8 @@ class OpenWrtRouter(base.BaseDevice):
             connection_type = "ser2net"
 
         self.logfile_read = output
+        # the console server may ask for it, see ser2net_connection.py
+        self.password = password
         self.connection = connection_decider.connection(connection_type, device=self, conn_cmd=conn_cmd, **kwargs)
         self.connection.connect()
 
@@ -78,6 +90,10 @@ class OpenWrtRouter(base.BaseDevice):
             self.tftp_server = None
         self.lan_iface = "eth1"
         self.wan_iface = "eth0"
+        # seconds of flashing skipped because partitions were unchanged,
+        # and checks of flashed partitions, in the last boot, see flash_check.py
+        self.flash_time_saved = 0
+        self.flash_verifications = []
         atexit.register(self.kill_console_at_exit)
 
     def reset(self, break_into_uboot=False):
@@ -117,6 +133,14 @@ class OpenWrtRouter(base.BaseDevice):
         self.expect(self.prompt)
         return seconds_up
 
+    def get_boot_id(self):
+        '''Return random id that changes every time the router boots.'''
+        self.sendline('\ncat /proc/sys/kernel/random/boot_id')
+        self.expect('([0-9a-f-]{36})\r\n')
+        boot_id = self.match.group(1)
+        self.expect(self.prompt)
+        return boot_id
+
     def get_memfree(self):
         '''Return the kB of free memory.'''
         # free pagecache, dentries and inodes for higher accuracy
@@ -133,6 +157,7 @@ class OpenWrtRouter(base.BaseDevice):
         '''
         OpenWrt routers have a webserver, so we use that to download
         the file via a webproxy (e.g. a device on the board's LAN).
+        See fetch() for a faster way without a webproxy.
         '''
         if not self.web_proxy:
             raise Exception('No web proxy defined to access board.')
@@ -148,6 +173,19 @@ class OpenWrtRouter(base.BaseDevice):
         print("\nAttempting download of %s via proxy %s" % (url, self.web_proxy+':8080'))
         return urllib2.urlopen(url, timeout=30)
 
+    def fetch(self, path, local=None, timeout=600):
+        '''
+        Copy a file from the board to this computer, the fastest way
+        available, see transfer.py. Return the name of the local file.
+        '''
+        from devices import lan
+        return transfer.fetch(self, path, local=local, lan=lan, timeout=timeout)
+
+    def push(self, local, path, timeout=600):
+        '''Copy a file from this computer to the board, see transfer.py.'''
+        from devices import lan
+        transfer.push(self, local, path, lan=lan, timeout=timeout)
+
     def tftp_get_file(self, host, filename, timeout=30):
         '''Download file from tftp server.'''
         self.sendline("tftp-hpa %s" % host)
@@ -176,13 +214,33 @@ class OpenWrtRouter(base.BaseDevice):
                 self.expect(self.uprompt)
         raise Exception("TFTP failed, try rebooting the board.")
 
+    def stage_files(self, fnames):
+        '''Start downloading files and copying them to the tftp server, see staging.py.'''
+        servers = []
+        if self.tftp_server:
+            servers.append((self.tftp_server, getattr(self, 'tftp_username', None),
+                            getattr(self, 'tftp_password', None)))
+        staging.stage(fnames, servers)
+
     def prepare_file(self, fname):
         '''Copy file to tftp server, so that it it available to tftp
         to the board itself.'''
-        if fname.startswith("http://") or fname.startswith("https://"):
-            return common.download_from_web(fname, self.tftp_server, self.tftp_username, self.tftp_password)
-        else:
-            return common.scp_to_tftp_server(os.path.abspath(fname), self.tftp_server, self.tftp_username, self.tftp_password)
+        staged = staging.tftp_name(fname, self.tftp_server, self.tftp_username, self.tftp_password)
+        if staged is not None:
+            return staged
+        return common.cache_to_tftp_server(fname, self.tftp_server, self.tftp_username, self.tftp_password)
+
+    def flash_unchanged(self, name, fname, addr, read=None, ram=None):
+        '''Check if flash at addr already holds image fname, see flash_check.py.'''
+        return flash_check.flash_unchanged(self, name, fname, addr, read=read, ram=ram)
+
+    def flash_done(self, name, start):
+        '''Remember how long flashing partition name took, since time start.'''
+        flash_check.flash_done(self, name, start)
+
+    def flash_verify(self, name, fname, addr, read=None, ram=None):
+        '''Check that flash at addr holds image fname, see flash_check.py.'''
+        return flash_check.verify(self, name, fname, addr, read=read, ram=ram)
 
     def install_package(self, fname):
         '''Install OpenWrt package (opkg).'''
@@ -255,8 +313,18 @@ class OpenWrtRouter(base.BaseDevice):
     def kill_console_at_exit(self):
         self.kill(signal.SIGHUP)
 
-    def wait_for_network(self):
+    def wait_until(self, state, timeout=60):
+        '''Wait until a stage of the boot is reached, or the board is ready, see boot_stages.py.'''
+        boot_stages.wait_until(self, state, timeout=timeout)
+
+    def wait_for_network(self, timeout=90):
         '''Wait until network interfaces have IP Addresses.'''
+        try:
+            self.wait_until('network', timeout=timeout)
+            return
+        except Exception as e:
+            print(e)
+            print("Unable to ask netifd for the state of interfaces, checking them one by one")
         for interface in [self.wan_iface, "br-lan"]:
             for i in range(5):
                 try:
@@ -278,8 +346,6 @@ class OpenWrtRouter(base.BaseDevice):
         self.expect(self.prompt)
         self.sendline('/etc/init.d/network restart')
         self.expect(self.prompt, timeout=40)
-        self.sendline('ifconfig')
-        self.expect(self.prompt)
         self.wait_for_network()
 
     def firewall_restart(self):
@@ -287,12 +353,12 @@ class OpenWrtRouter(base.BaseDevice):
         start = datetime.now()
         self.sendline('/etc/init.d/firewall restart')
         self.expect_exact(["Loading redirects", "* Running script '/usr/share/miniupnpd/firewall.include'", "Running script '/etc/firewall.user'"])
-        if 'StreamBoost' in self.before:
-            print("test_msg: Sleeping for Streamboost")
-            time.sleep(45)
-        else:
-            time.sleep(15)
+        streamboost = 'StreamBoost' in self.before
         self.expect(self.prompt, timeout=80)
+        self.wait_until('firewall', timeout=60)
+        if streamboost:
+            # StreamBoost restarts its daemons after the firewall
+            self.wait_until('services', timeout=60)
         return int((datetime.now() - start).seconds)
 
     def get_wan_iface(self):
@@ -315,12 +381,23 @@ class OpenWrtRouter(base.BaseDevice):
         self.expect(self.uprompt)
         self.sendline('setenv ethact eth0')
         self.expect(self.uprompt)
-        time.sleep(30) # running dhcp too soon causes hang
+        # running dhcp too soon after U-Boot starts causes hang
+        since = self.boot_stages.since('uboot')
+        if since is None or since < 30:
+            time.sleep(30 - (since or 0))
         self.sendline('dhcp')
         self.expect('DHCP client bound to address', timeout=60)
         self.expect(self.uprompt)
         self.sendline('setenv serverip %s' % TFTP_SERVER)
         self.expect(self.uprompt)
+        # U-Boot only asks for these if the variables are set, and older
+        # versions ignore them
+        if tftp_blocksize:
+            self.sendline('setenv tftpblocksize %s' % tftp_blocksize)
+            self.expect(self.uprompt)
+        if tftp_windowsize:
+            self.sendline('setenv tftpwindowsize %s' % tftp_windowsize)
+            self.expect(self.uprompt)
         if TFTP_SERVER:
             #interfaces=['eth1','eth0']
             passed = False
@@ -358,15 +435,16 @@ class OpenWrtRouter(base.BaseDevice):
 
     def wait_for_linux(self):
         '''Verify Linux starts up.'''
-        self.expect(['Booting Linux', 'Starting kernel ...'], timeout=45)
-        i = self.expect(['Please press Enter to activate this console', 'U-Boot'], timeout=150)
-        if i == 1:
-            raise Exception('U-Boot came back when booting kernel')
+        self.wait_until('kernel', timeout=45)
+        self.wait_until('console', timeout=150)
+        self.wait_until('prompt', timeout=30)
         # Give things time to start or crash on their own.
         # Some things, like wifi, take a while.
-        time.sleep(40)
-        self.sendline('\r')
-        self.expect(self.prompt)
+        try:
+            self.wait_until('services', timeout=60)
+        except Exception as e:
+            print(e)
+            print("Not all services are running yet")
         self.sendline('uname -a')
         self.expect('Linux ')
         self.expect(self.prompt)
@@ -379,7 +457,6 @@ class OpenWrtRouter(base.BaseDevice):
                 self.sendline("uci commit")
                 self.expect(self.prompt)
                 self.network_restart()
-                time.sleep(10)
         if "pppoe" in proto:
             self.wan_iface = "pppoe-wan"
             if self.get_wan_proto() != "pppoe":
@@ -387,7 +464,6 @@ class OpenWrtRouter(base.BaseDevice):
                 self.sendline("uci commit")
                 self.expect(self.prompt)
                 self.network_restart()
-                time.sleep(10)
 
     def uci_allow_wan_http(self):
         '''Allow access to webgui from devices on WAN interface.'''
@@ -396,33 +472,45 @@ class OpenWrtRouter(base.BaseDevice):
     def uci_allow_wan_ssh(self):
         self.uci_forward_traffic_redirect("tcp", "22", "192.168.1.1")
 
+    # name of firewall sections added by tests, so that they can be
+    # removed again without touching those of the image
+    firewall_name = 'bft'
+
     def uci_forward_traffic_redirect(self, tcp_udp, port_wan, ip_lan):
-        self.sendline('uci add firewall redirect')
-        self.sendline('uci set firewall.@redirect[-1].src=wan')
-        self.sendline('uci set firewall.@redirect[-1].src_dport=%s' % port_wan)
-        self.sendline('uci set firewall.@redirect[-1].proto=%s' % tcp_udp)
-        self.sendline('uci set firewall.@redirect[-1].dest_ip=%s' % ip_lan)
-        self.sendline('uci commit firewall')
+        self.run_batch(['uci add firewall redirect',
+                        'uci set firewall.@redirect[-1].name=%s' % self.firewall_name,
+                        'uci set firewall.@redirect[-1].src=wan',
+                        'uci set firewall.@redirect[-1].src_dport=%s' % port_wan,
+                        'uci set firewall.@redirect[-1].proto=%s' % tcp_udp,
+                        'uci set firewall.@redirect[-1].dest_ip=%s' % ip_lan,
+                        'uci commit firewall'], check=False)
         self.firewall_restart()
 
     def uci_forward_traffic_rule(self, tcp_udp, port, ip, target="ACCEPT"):
-        self.sendline('uci add firewall rule')
-        self.sendline('uci set firewall.@rule[-1].src=wan')
-        self.sendline('uci set firewall.@rule[-1].proto=%s' % tcp_udp)
-        self.sendline('uci set firewall.@rule[-1].dest=lan')
-        self.sendline('uci set firewall.@rule[-1].dest_ip=%s' % ip)
-        self.sendline('uci set firewall.@rule[-1].dest_port=%s' % port)
-        self.sendline('uci set firewall.@rule[-1].target=%s' % target)
-        self.sendline('uci commit firewall')
+        self.run_batch(['uci add firewall rule',
+                        'uci set firewall.@rule[-1].name=%s' % self.firewall_name,
+                        'uci set firewall.@rule[-1].src=wan',
+                        'uci set firewall.@rule[-1].proto=%s' % tcp_udp,
+                        'uci set firewall.@rule[-1].dest=lan',
+                        'uci set firewall.@rule[-1].dest_ip=%s' % ip,
+                        'uci set firewall.@rule[-1].dest_port=%s' % port,
+                        'uci set firewall.@rule[-1].target=%s' % target,
+                        'uci commit firewall'], check=False)
         self.firewall_restart()
 
     # Optional send and expect functions to try and be fancy at catching errors
     in_detect_fatal_error = False
-    def send(self, s):
+    def detect_fatal_error(self):
+        '''Handle crashes found in the console output, see error_detect.py.'''
         if not self.in_detect_fatal_error and self.linux_booted:
             self.in_detect_fatal_error = True
-            error_detect.detect_fatal_error(self)
-            self.in_detect_fatal_error = False
+            try:
+                error_detect.detect_fatal_error(self)
+            finally:
+                self.in_detect_fatal_error = False
+
+    def send(self, s):
+        self.detect_fatal_error()
         if BFT_DEBUG:
             common.print_bold("%s = sending: %s" %
                     (error_detect.caller_file_line(3), repr(s)))
@@ -435,10 +523,7 @@ class OpenWrtRouter(base.BaseDevice):
         try:
             return super(OpenWrtRouter, self).expect(*args, **kwargs)
         except:
-            if not self.in_detect_fatal_error and self.linux_booted:
-                self.in_detect_fatal_error = True
-                error_detect.detect_fatal_error(self)
-                self.in_detect_fatal_error = False
+            self.detect_fatal_error()
             if BFT_DEBUG:
                 common.print_bold("expired")
             raise
@@ -461,6 +546,5 @@ if __name__ == '__main__':
     # Example downloading a file from the board
     remote_fname = '/tmp/dhcp.leases'
     local_fname = '/tmp/dhcp.leases'
-    with open(local_fname, 'wb') as local_file:
-        local_file.write(board.get_file(remote_fname).read())
-        print("\nCreated %s" % local_fname)
+    board.fetch(remote_fname, local_fname)
+    print("\nCreated %s" % local_fname)
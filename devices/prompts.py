@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Prompts of devices, compiled once into a single search.
+
+Given a list of patterns, pexpect compiles every one of them on each
+expect() call and then searches the whole buffer once per pattern. A
+Prompt is still a list of patterns, but BaseDevice.expect() searches
+for all of them with one alternation, compiled only when the list
+changes. Patterns starting with ".*" can only match where the search
+starts, so they are tried there alone instead of at every position of
+the buffer.
+
+Run this file to compare the cost of both:
+
+  ./devices/prompts.py
+'''
+
+import re
+
+
+def _alternation(indexed):
+    '''
+    Compile (index, pattern) pairs into one regular expression, and
+    return it with a dictionary of group number -> index of pattern.
+    '''
+    parts = []
+    groups = {}
+    n = 1
+    for i, p in indexed:
+        groups[n] = i
+        n += re.compile(p, re.DOTALL).groups + 1
+        parts.append('(%s)' % p)
+    return re.compile('|'.join(parts), re.DOTALL), groups
+
+
+class Prompt(list):
+    '''
+    A list of prompt patterns. Use it like any list, e.g.
+    "board.expect(prompt)" or "prompt + ['=> ']".
+    '''
+
+    def __add__(self, other):
+        return Prompt(list(self) + list(other))
+
+    def compile(self):
+        key = tuple(getattr(p, 'pattern', p) for p in self)
+        if self.__dict__.get('_key') == key:
+            return
+        anchored = [(i, p) for i, p in enumerate(key)
+                    if p.startswith('.*') and '|' not in p]
+        others = [(i, p) for i, p in enumerate(key) if (i, p) not in anchored]
+        self._anchored = _alternation(anchored) if anchored else None
+        self._others = _alternation(others) if others else None
+        self._patterns = [re.compile(p, re.DOTALL) for p in key]
+        self._key = key
+
+    def search(self, buffer, pos=0):
+        '''
+        Find the first prompt in buffer from pos on, the same one pexpect
+        would find given the list of patterns. Return (index of the prompt,
+        match of that prompt) or None.
+        '''
+        self.compile()
+        found = []
+        for r in (self._anchored, self._others):
+            if r is None:
+                continue
+            regex, groups = r
+            if r is self._anchored:
+                m = regex.match(buffer, pos)
+            else:
+                m = regex.search(buffer, pos)
+            if m is not None:
+                found.append((m.start(), groups[m.lastindex]))
+        if not found:
+            return None
+        start, i = min(found)
+        return i, self._patterns[i].match(buffer, start)
+
+
+class PromptSearcher(object):
+    '''Searcher for pexpect's expect_loop(), finding a Prompt.'''
+
+    eof_index = -1
+    timeout_index = -1
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        if searchwindowsize is None:
+            pos = 0
+        else:
+            pos = max(0, len(buffer) - searchwindowsize)
+        found = self.prompt.search(buffer, pos)
+        if found is None:
+            return -1
+        index, self.match = found
+        self.start = self.match.start()
+        self.end = self.match.end()
+        return index
+
+
+def benchmark(iterations=1000):
+    '''Print CPU time of one search for a prompt, as pexpect does it and merged.'''
+    import time
+    import pexpect
+
+    prompt = ['root\\@.*:.*#', '/ # ', '@R7500:/# ', ".*:~ #", ".*:~.*\\$", ".*\\@.*:.*\\$",
+              'ath>', '\\(IPQ\\) #', 'ar7240>', '\\(IPQ40xx\\)', '\\(QCA961x\\) #']
+    # typical buffer after a command: some output, then a prompt
+    buf = "".join("[%d] some console output line %d\r\n" % (i, i) for i in range(40))
+    buf += "root@OpenWrt:/# "
+    # only used to compile patterns the way pexpect does
+    spawn = (pexpect.spawn if str is bytes else pexpect.spawnu)('cat')
+
+    def pexpect_list():
+        searcher = pexpect.searcher_re(spawn.compile_pattern_list(prompt))
+        return searcher.search(buf, len(buf)), searcher.start, searcher.end
+
+    merged = Prompt(prompt)
+    def prompt_search():
+        searcher = PromptSearcher(merged)
+        return searcher.search(buf, len(buf)), searcher.start, searcher.end
+
+    assert pexpect_list() == prompt_search()
+    for name, f in (("list of patterns", pexpect_list), ("Prompt", prompt_search)):
+        start = time.clock() if hasattr(time, 'clock') else time.process_time()
+        for i in range(iterations):
+            f()
+        end = time.clock() if hasattr(time, 'clock') else time.process_time()
+        print("%-20s %6.1f us per expect" % (name, (end - start) * 1e6 / iterations))
+    spawn.close()
+
+
+if __name__ == '__main__':
+    benchmark()
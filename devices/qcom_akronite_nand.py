@@ -5,6 +5,8 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import time
+
 import common
 import qcom_arm_base
 
@@ -30,21 +32,32 @@ class QcomAkroniteRouterNAND(qcom_arm_base.QcomArmBase):
     def flash_uboot(self, uboot):
         '''Flash Universal Bootloader image.'''
         common.print_bold("\n===== Flashing u-boot =====\n")
-        filename = self.prepare_file(uboot)
-        size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
+        # the u-boot partition only reads back right in the sbl nand layout
         self.sendline('ipq_nand sbl')
         self.expect(self.uprompt)
-        self.nand_flash_bin(self.uboot_addr, self.uboot_size, self.uboot_ddr_addr)
+        if self.flash_unchanged('uboot', uboot, self.uboot_addr, read='nand', ram=self.uboot_ddr_addr):
+            self.sendline('ipq_nand linux')
+            self.expect(self.uprompt)
+            return
+        start = time.time()
+        filename = self.prepare_file(uboot)
+        size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
+        self.nand_flash_bin(self.uboot_addr, self.uboot_size, self.uboot_ddr_addr, fname=uboot, name='uboot')
+        self.flash_done('uboot', start)
         self.reset()
         self.wait_for_boot()
         self.setup_uboot_network()
 
     def flash_rootfs(self, ROOTFS):
         common.print_bold("\n===== Flashing rootfs =====\n")
+        if self.flash_unchanged('rootfs', ROOTFS, self.rootfs_addr, read='nand', ram=self.uboot_ddr_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(ROOTFS)
 
         size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
-        self.nand_flash_bin(self.rootfs_addr, self.rootfs_size, self.uboot_ddr_addr)
+        self.nand_flash_bin(self.rootfs_addr, self.rootfs_size, self.uboot_ddr_addr, fname=ROOTFS, name='rootfs')
+        self.flash_done('rootfs', start)
 
     def flash_linux(self, KERNEL):
         common.print_bold("\n===== Flashing linux =====\n")
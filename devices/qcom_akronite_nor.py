@@ -5,6 +5,8 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import time
+
 import common
 import qcom_arm_base
 
@@ -24,17 +26,25 @@ class QcomAkroniteRouterNOR(qcom_arm_base.QcomArmBase):
 
     def flash_rootfs(self, ROOTFS):
         common.print_bold("\n===== Flashing rootfs =====\n")
+        if self.flash_unchanged('rootfs', ROOTFS, "0x006b0000", read='sf', ram=self.uboot_ddr_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(ROOTFS)
 
         size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
-        self.spi_flash_bin("0x006b0000", size, self.uboot_ddr_addr, "0x1920000")
+        self.spi_flash_bin("0x006b0000", size, self.uboot_ddr_addr, "0x1920000", fname=ROOTFS, name='rootfs')
+        self.flash_done('rootfs', start)
 
     def flash_linux(self, KERNEL):
         common.print_bold("\n===== Flashing linux =====\n")
+        if self.flash_unchanged('kernel', KERNEL, "0x0062b0000", read='sf', ram=self.uboot_ddr_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(KERNEL)
 
         size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
-        self.spi_flash_bin("0x0062b0000", size, self.uboot_ddr_addr, "0x400000")
+        self.spi_flash_bin("0x0062b0000", size, self.uboot_ddr_addr, "0x400000", fname=KERNEL, name='kernel')
+        self.flash_done('kernel', start)
 
     def boot_linux(self, rootfs=None):
         common.print_bold("\n===== Booting linux for %s on %s =====" % (self.model, self.root_type))
@@ -7,12 +7,13 @@
 
 import common
 import openwrt_router
+import prompts
 
 
 class QcomArmBase(openwrt_router.OpenWrtRouter):
 
-    prompt = ['root\\@.*:.*#', ]
-    uprompt = ['\(IPQ\) #', '\(IPQ40xx\)', '\(QCA961x\) #']
+    prompt = prompts.Prompt(['root\\@.*:.*#', ])
+    uprompt = prompts.Prompt(['\(IPQ\) #', '\(IPQ40xx\)', '\(QCA961x\) #'])
 
     def check_memory_addresses(self):
         '''Before flashing, dynamically find addresses and memory size.'''
@@ -77,7 +78,12 @@ class QcomArmBase(openwrt_router.OpenWrtRouter):
         self.wait_for_boot()
         self.setup_uboot_network()
 
-    def nand_flash_bin(self, addr, size, src):
+    def nand_flash_bin(self, addr, size, src, fname=None, name='image'):
+        '''
+        Flash the image loaded at $fileaddr to the nand partition at addr
+        of size bytes, and check it using src as scratch memory. fname is
+        the local image, see flash_check.verify().
+        '''
         # make sure we round writes up to the next sector size
         hsize = hex((((int(size, 0) - 1) / self.flash_block_size) + 1) * self.flash_block_size)
 
@@ -87,16 +93,14 @@ class QcomArmBase(openwrt_router.OpenWrtRouter):
         self.sendline("nand write $fileaddr %s %s" % (addr, hsize))
         self.expect("OK", timeout=90)
         self.expect(self.uprompt)
-        self.sendline("nand read %s %s %s" % (src, addr, hsize))
-        self.expect(self.uprompt)
-        self.sendline("echo $filesize")
-        self.readline()
-        size = int(self.readline(), 16)
-        self.sendline("cmp.b $fileaddr %s %s" % (src, hex(size - 1)))
-        self.expect("Total of %s byte\(s\) were the same" % (size - 1))
-        self.expect(self.uprompt)
+        self.flash_verify(name, fname, addr, read='nand', ram=src)
 
-    def spi_flash_bin(self, addr, size, src, esize=None):
+    def spi_flash_bin(self, addr, size, src, esize=None, fname=None, name='image'):
+        '''
+        Flash size bytes at src to the spi flash partition at addr of
+        esize bytes, and check them. fname is the local image, see
+        flash_check.verify().
+        '''
         if esize == None:
             esize = size
 
@@ -109,6 +113,7 @@ class QcomArmBase(openwrt_router.OpenWrtRouter):
         hsize = hex(size)
         self.sendline('sf write %s %s %s' % (src, addr, hsize))
         self.expect(self.uprompt, timeout=180)
+        self.flash_verify(name, fname, addr, read='sf', ram=src)
 
     def perf_args(self, events, kernel_user="ku"):
         if len(events) > 4:
@@ -5,6 +5,8 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import time
+
 import common
 import qcom_arm_base
 
@@ -24,17 +26,25 @@ class QcomDakotaRouterNOR(qcom_arm_base.QcomArmBase):
 
     def flash_rootfs(self, ROOTFS):
         common.print_bold("\n===== Flashing rootfs =====\n")
+        if self.flash_unchanged('rootfs', ROOTFS, self.rootfs_addr, read='sf', ram=self.uboot_ddr_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(ROOTFS)
 
         size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
-        self.spi_flash_bin(self.rootfs_addr, size, self.uboot_ddr_addr, self.rootfs_size)
+        self.spi_flash_bin(self.rootfs_addr, size, self.uboot_ddr_addr, self.rootfs_size, fname=ROOTFS, name='rootfs')
+        self.flash_done('rootfs', start)
 
     def flash_linux(self, KERNEL):
         common.print_bold("\n===== Flashing linux =====\n")
+        if self.flash_unchanged('kernel', KERNEL, self.kernel_addr, read='sf', ram=self.uboot_ddr_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(KERNEL)
 
         size = self.tftp_get_file_uboot(self.uboot_ddr_addr, filename)
-        self.spi_flash_bin(self.kernel_addr, size, self.uboot_ddr_addr, self.kernel_size)
+        self.spi_flash_bin(self.kernel_addr, size, self.uboot_ddr_addr, self.kernel_size, fname=KERNEL, name='kernel')
+        self.flash_done('kernel', start)
 
     def boot_linux(self, rootfs=None):
         common.print_bold("\n===== Booting linux for %s on %s =====" % (self.model, self.root_type))
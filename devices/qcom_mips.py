@@ -5,8 +5,11 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import time
+
 import common
 import openwrt_router
+import prompts
 
 
 class QcomMipsRouter(openwrt_router.OpenWrtRouter):
@@ -14,8 +17,8 @@ class QcomMipsRouter(openwrt_router.OpenWrtRouter):
     Board with a MIPS processor.
     '''
 
-    prompt = ['root\\@.*:.*#', ]
-    uprompt = ['ath>', 'ar7240>']
+    prompt = prompts.Prompt(['root\\@.*:.*#', ])
+    uprompt = prompts.Prompt(['ath>', 'ar7240>'])
 
     def __init__(self, *args, **kwargs):
         super(QcomMipsRouter, self).__init__(*args, **kwargs)
@@ -36,6 +39,9 @@ class QcomMipsRouter(openwrt_router.OpenWrtRouter):
     def flash_rootfs(self, ROOTFS):
         '''Flash Root File System image'''
         common.print_bold("\n===== Flashing rootfs =====\n")
+        if self.model != "ap135-nand" and self.flash_unchanged('rootfs', ROOTFS, self.rootfs_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(ROOTFS)
         if self.model == "ap135-nand":
             self.tftp_get_file_uboot("0x82060000", filename)
@@ -45,6 +51,7 @@ class QcomMipsRouter(openwrt_router.OpenWrtRouter):
             self.sendline('nand write.jffs2 0x82060000 0x700000 $filesize')
             self.expect('OK')
             self.expect(self.uprompt)
+            self.flash_verify('rootfs', ROOTFS, '0x700000', read='nand', ram='0x82060000')
             # erase the overlay otherwise, things will be in a weird state
             self.sendline('nand erase 0x1F00000')
             self.expect('OK')
@@ -57,11 +64,14 @@ class QcomMipsRouter(openwrt_router.OpenWrtRouter):
         self.sendline('cp.b $fileaddr %s $filesize' % self.rootfs_addr)
         self.expect('done', timeout=80)
         self.expect(self.uprompt)
-        self.sendline('cmp.b $fileaddr %s $filesize' % self.rootfs_addr)
-        self.expect('Total of .* bytes were the same')
+        self.flash_verify('rootfs', ROOTFS, self.rootfs_addr)
+        self.flash_done('rootfs', start)
 
     def flash_linux(self, KERNEL):
         common.print_bold("\n===== Flashing linux =====\n")
+        if self.model != "ap135-nand" and self.flash_unchanged('kernel', KERNEL, self.kernel_addr):
+            return
+        start = time.time()
         filename = self.prepare_file(KERNEL)
         self.tftp_get_file_uboot("0x82060000", filename)
         if self.model == "ap135-nand":
@@ -71,15 +81,16 @@ class QcomMipsRouter(openwrt_router.OpenWrtRouter):
             self.sendline('nand write.jffs2 0x82060000 0x100000 $filesize')
             self.expect('OK')
             self.expect(self.uprompt)
+            self.flash_verify('kernel', KERNEL, '0x100000', read='nand', ram='0x82060000')
             return
         self.sendline('erase %s +$filesize' % self.kernel_addr)
         self.expect('Erased .* sectors', timeout=60)
         self.expect(self.uprompt)
         self.sendline('cp.b $fileaddr %s $filesize' % self.kernel_addr)
         self.expect('done', timeout=60)
-        self.sendline('cmp.b $fileaddr %s $filesize' % self.kernel_addr)
-        self.expect('Total of .* bytes were the same')
         self.expect(self.uprompt)
+        self.flash_verify('kernel', KERNEL, self.kernel_addr)
+        self.flash_done('kernel', start)
 
     def boot_linux(self, rootfs=None):
         common.print_bold("\n===== Booting linux for %s on %s =====" % (self.model, self.root_type))
@@ -1,4 +1,5 @@
 import pexpect
+import session_broker
 
 class Ser2NetConnection():
     def __init__(self, device=None, conn_cmd=None, **kwargs):
@@ -6,17 +7,17 @@ class Ser2NetConnection():
         self.conn_cmd = conn_cmd
 
     def connect(self):
+        command, args = session_broker.command('/bin/bash', ['-c', self.conn_cmd])
         pexpect.spawn.__init__(self.device,
-                               command='/bin/bash',
-                               args=['-c', self.conn_cmd],
-                               **kwargs)
+                               command=command,
+                               args=args)
         try:
-            result = self.device.expect(["assword:", "ser2net", "OpenGear Serial Server"])
+            result = self.device.expect(["assword:", "ser2net", "OpenGear Serial Server", session_broker.resumed])
         except pexpect.EOF as e:
             raise Exception("Board is in use (connection refused).")
         if result == 0:
-            self.device.sendline(password)
+            self.device.sendline(self.device.password)
             self.device.expect("OpenGear Serial Server")
 
-    def close():
+    def close(self):
         self.device.sendline("~.")
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Keep device sessions (board console, ssh to wan/lan devices) open
+between runs of bft.
+
+A broker daemon owns the sessions and listens on a Unix socket.
+Instead of spawning e.g. "ssh root@10.0.0.5", a device spawns this
+file in "attach" mode, which asks the broker for the session running
+that same command and relays bytes between it and the device. When
+bft exits only the relay dies, the session itself stays open, and
+console output seen while no bft was attached is replayed on the
+next attach.
+
+Start a broker by running bft with --broker, or by hand:
+
+  ./devices/session_broker.py serve /tmp/bft-broker.sock
+'''
+
+import collections
+import errno
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import time
+
+# Printed to a client that attaches to an existing session, so that
+# devices know not to wait for a login banner.
+resumed = "bft-broker: resumed session"
+
+# Location of the broker socket, if sessions should go through a broker
+socket_path = None
+
+default_socket_path = "/tmp/bft-broker-%s.sock" % os.getuid()
+
+
+def command(cmd, args=[]):
+    '''
+    Return (command, args) to spawn for a session: unchanged if no
+    broker is used, otherwise a relay through the broker.
+    '''
+    if socket_path is None:
+        return cmd, args
+    return sys.executable, [os.path.realpath(__file__), 'attach', socket_path, '--', cmd] + list(args)
+
+
+def is_running(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except socket.error:
+        return False
+    finally:
+        s.close()
+    return True
+
+
+def start(path=default_socket_path, timeout=10):
+    '''Start a broker daemon listening on path, unless one already is.'''
+    global socket_path
+    if not is_running(path):
+        log = open(path + '.log', 'a')
+        subprocess.Popen([sys.executable, os.path.realpath(__file__), 'serve', path],
+                         stdin=open(os.devnull), stdout=log, stderr=log,
+                         preexec_fn=os.setsid, close_fds=True)
+        for i in range(timeout * 10):
+            if is_running(path):
+                break
+            time.sleep(0.1)
+        else:
+            raise Exception("Session broker did not start, see %s.log" % path)
+    socket_path = path
+
+
+class Session(object):
+    '''A command running in a pty, owned by the broker.'''
+
+    # bytes of output kept for replay
+    history_size = 1024 * 1024
+
+    # bytes of output a client may fall behind before it is dropped
+    backlog_size = 1024 * 1024
+
+    def __init__(self, cmd, args):
+        import pexpect
+        self.spawn = pexpect.spawn(cmd, args)
+        self.fd = self.spawn.child_fd
+        self.client = None
+        # output not sent to the client yet
+        self.pending = ""
+        self.history = collections.deque()
+        self.history_len = 0
+        # total bytes of output, and where the last client left off
+        self.offset = 0
+        self.detached_at = 0
+
+    def output(self, data):
+        self.history.append(data)
+        self.history_len += len(data)
+        self.offset += len(data)
+        while self.history_len - len(self.history[0]) >= self.history_size:
+            self.history_len -= len(self.history.popleft())
+        if self.client is not None:
+            self.pending += data
+
+    def flush(self):
+        '''
+        Send as much pending output to the client as it takes without
+        blocking. Return False if the client should be dropped: it is
+        gone, or too far behind.
+        '''
+        try:
+            sent = self.client.send(self.pending)
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            sent = 0
+        self.pending = self.pending[sent:]
+        return len(self.pending) <= self.backlog_size
+
+    def unseen(self):
+        '''Return output produced since the last client detached.'''
+        data = "".join(self.history)
+        return data[max(0, len(data) - (self.offset - self.detached_at)):]
+
+    def attach(self, client):
+        # one stalled client must not block the other sessions
+        client.setblocking(0)
+        self.client = client
+        self.pending = ""
+
+    def detach(self):
+        self.client = None
+        # output the client never got is replayed on the next attach
+        self.detached_at = self.offset - len(self.pending)
+        self.pending = ""
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.spawn.close(force=True)
+
+
+class Broker(object):
+    '''Own sessions and hand them out to clients over a Unix socket.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.sessions = {}
+        self.handshakes = {}
+        self.clients = {}
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # whoever can connect can run commands as this user
+        umask = os.umask(0o177)
+        try:
+            self.listener.bind(path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        self.listener.listen(16)
+
+    def log(self, msg):
+        print("%s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), msg))
+        sys.stdout.flush()
+
+    def handshake(self, client, line):
+        '''First line from a client names the command of its session.'''
+        req = json.loads(line)
+        if req.get('stop'):
+            self.log("stop requested")
+            raise KeyboardInterrupt
+        key = json.dumps([req['command']] + req['args'])
+        s = self.sessions.get(key)
+        if s is not None and s.spawn.isalive():
+            self.log("client resumed %s" % key)
+            if s.client is not None:
+                # a new bft run takes over from a stale one
+                self.drop_client(s.client)
+            unseen = s.unseen()
+            s.attach(client)
+            s.pending = "\r\n%s\r\n" % resumed + unseen
+        else:
+            self.log("client started %s" % key)
+            s = self.sessions[key] = Session(req['command'], req['args'])
+            s.attach(client)
+        self.clients[client] = s
+        self.flush(s)
+
+    def flush(self, s):
+        if s.client is not None and not s.flush():
+            self.log("dropped client falling behind")
+            self.drop_client(s.client)
+
+    def drop_client(self, client):
+        s = self.clients.pop(client, None)
+        if s is not None and s.client is client:
+            s.detach()
+        client.close()
+
+    def serve(self):
+        self.log("listening on %s" % self.path)
+        try:
+            while True:
+                fds = [self.listener] + list(self.handshakes) + list(self.clients)
+                fds += [s.fd for s in self.sessions.values()]
+                writers = [s.client for s in self.sessions.values() if s.client is not None and s.pending]
+                r, w, x = select.select(fds, writers, [])
+                for f in w:
+                    if f in self.clients:
+                        self.flush(self.clients[f])
+                for f in r:
+                    if f is self.listener:
+                        client, addr = self.listener.accept()
+                        self.handshakes[client] = ""
+                    elif f in self.handshakes:
+                        data = f.recv(4096)
+                        if not data:
+                            del self.handshakes[f]
+                            f.close()
+                            continue
+                        buf = self.handshakes[f] + data
+                        if '\n' not in buf:
+                            self.handshakes[f] = buf
+                            continue
+                        del self.handshakes[f]
+                        line, rest = buf.split('\n', 1)
+                        try:
+                            self.handshake(f, line)
+                        except (ValueError, KeyError) as e:
+                            self.log("bad request %r: %s" % (line, e))
+                            f.close()
+                            continue
+                        if rest and f in self.clients:
+                            os.write(self.clients[f].fd, rest)
+                    elif f in self.clients:
+                        try:
+                            data = f.recv(4096)
+                        except socket.error:
+                            data = ""
+                        if not data:
+                            self.drop_client(f)
+                        elif self.clients[f].client is f:
+                            os.write(self.clients[f].fd, data)
+                    else:
+                        self.read_session(f)
+        finally:
+            for s in self.sessions.values():
+                s.close()
+            self.listener.close()
+            os.unlink(self.path)
+
+    def read_session(self, fd):
+        for key, s in self.sessions.items():
+            if s.fd == fd:
+                break
+        else:
+            return
+        try:
+            data = os.read(fd, 4096)
+        except OSError as e:
+            if e.errno != errno.EIO:
+                raise
+            data = ""
+        if data:
+            s.output(data)
+            self.flush(s)
+            return
+        # session ended, e.g. a device rebooted
+        self.log("session ended %s" % key)
+        if s.client is not None:
+            self.clients.pop(s.client, None)
+        s.close()
+        del self.sessions[key]
+
+
+def attach(path, cmd, args):
+    '''Relay stdin/stdout to the broker session running cmd.'''
+    import termios
+    import tty
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(json.dumps({'command': cmd, 'args': args}) + '\n')
+    old = None
+    if os.isatty(0):
+        # pass control characters on to the session untouched
+        old = termios.tcgetattr(0)
+        tty.setraw(0)
+    try:
+        while True:
+            r, w, x = select.select([0, s], [], [])
+            if s in r:
+                data = s.recv(4096)
+                if not data:
+                    break
+                os.write(1, data)
+            if 0 in r:
+                data = os.read(0, 4096)
+                if not data:
+                    break
+                s.sendall(data)
+    finally:
+        if old is not None:
+            termios.tcsetattr(0, termios.TCSADRAIN, old)
+
+
+def stop(path=default_socket_path):
+    '''Ask a running broker to close all sessions and exit.'''
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(json.dumps({'stop': True}) + '\n')
+    s.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Keep device sessions open between bft runs.')
+    parser.add_argument('action', choices=['serve', 'attach', 'stop'])
+    parser.add_argument('socket', nargs='?', default=default_socket_path)
+    parser.add_argument('cmd', nargs=argparse.REMAINDER, help='session command, for attach')
+    args = parser.parse_args()
+
+    if args.action == 'serve':
+        try:
+            Broker(args.socket).serve()
+        except KeyboardInterrupt:
+            pass
+    elif args.action == 'attach':
+        cmd = args.cmd
+        if cmd and cmd[0] == '--':
+            cmd = cmd[1:]
+        attach(args.socket, cmd[0], cmd[1:])
+    elif args.action == 'stop':
+        stop(args.socket)
@@ -0,0 +1,211 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Download images and copy them to the tftp server in the background.
+
+Before the board is reset, all images of a run (meta, u-boot, kernel,
+rootfs, packages) are staged at the same time, one thread each:
+
+  1. A url is checked with a HEAD request, and downloaded once into a
+     local cache. An interrupted download is resumed with a Range
+     request, and a cached copy is reused while the web server reports
+     the same ETag, Last-Modified and size.
+  2. The local file is copied to the tftp server, see
+     common.cache_to_tftp_server().
+
+When flashing asks for a file, prepare_file() waits for its staging to
+finish instead of starting the copy then.
+'''
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib2
+
+import common
+
+# Local copies of downloaded images
+cache_dir = os.path.join(os.path.expanduser('~'), '.bft', 'images')
+# Bytes of images to keep there, the least recently used are removed first
+cache_size = 10 * 1024 * 1024 * 1024
+
+# Attempts to download a file, each resuming where the last stopped
+retries = 5
+
+# Staging of each file: file name or url -> Image
+images = {}
+lock = threading.Lock()
+
+
+def is_url(fname):
+    return fname.startswith("http://") or fname.startswith("https://")
+
+
+def head(url, timeout=20):
+    '''
+    Check that url can be downloaded, without downloading it. Return
+    what the web server says about it: etag, last_modified, length.
+    '''
+    req = urllib2.Request(url)
+    req.get_method = lambda: 'HEAD'
+    info = urllib2.urlopen(req, timeout=timeout).info()
+    length = info.get('Content-Length')
+    return {'etag': info.get('ETag'),
+            'last_modified': info.get('Last-Modified'),
+            'length': int(length) if length is not None else None}
+
+
+def evict(keep):
+    '''Remove least recently used files from the cache, beyond cache_size bytes.'''
+    files = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if path != keep and not name.endswith(('.json', '.part', '.lock')):
+            files.append((os.path.getmtime(path), os.path.getsize(path), path))
+    total = sum(size for mtime, size, path in files)
+    for mtime, size, path in sorted(files):
+        if total <= cache_size:
+            break
+        total -= size
+        for f in (path, path + '.json', path + '.lock'):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def download(url):
+    '''Download url into the local cache, unless cached already. Return the local file name.'''
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fname = os.path.join(cache_dir, hashlib.sha256(url).hexdigest()[:16] + '-' + os.path.basename(url))
+    # boards run in parallel (see parallel.py) may want the same file
+    with open(fname + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return download_locked(url, fname)
+
+
+def download_locked(url, fname):
+    part = fname + '.part'
+    meta = head(url)
+    validated = meta['etag'] or meta['last_modified']
+    try:
+        saved = json.load(open(fname + '.json'))
+    except Exception:
+        saved = None
+    if validated and saved == meta and os.path.isfile(fname):
+        os.utime(fname, None)
+        common.print_bold("Using cached download of %s" % url)
+        return fname
+    if saved != meta or not validated:
+        # a partial download of another version of the file is useless
+        if os.path.exists(part):
+            os.remove(part)
+    json.dump(meta, open(fname + '.json', 'w'))
+
+    start = time.time()
+    for attempt in range(retries):
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        req = urllib2.Request(url)
+        if have:
+            req.add_header('Range', 'bytes=%d-' % have)
+            # the whole file is sent instead, if it changed
+            req.add_header('If-Range', meta['etag'] or meta['last_modified'])
+        try:
+            r = urllib2.urlopen(req, timeout=60)
+            with open(part, 'ab' if have and r.getcode() == 206 else 'wb') as f:
+                shutil.copyfileobj(r, f, 1024 * 1024)
+            size = os.path.getsize(part)
+            if meta['length'] is not None and size != meta['length']:
+                raise Exception("Got %s of %s bytes" % (size, meta['length']))
+        except Exception as e:
+            print(e)
+            common.print_bold("Download of %s interrupted, resuming" % url)
+            time.sleep(2 ** attempt)
+            continue
+        os.rename(part, fname)
+        seconds = max(time.time() - start, 0.001)
+        common.print_bold("Downloaded %s: %s bytes in %.1f s (%.1f MB/s)" %
+                          (url, size, seconds, size / 1024.0 / 1024 / seconds))
+        evict(fname)
+        return fname
+    raise Exception("Unable to download %s" % url)
+
+
+class Image(threading.Thread):
+    '''Downloads a file if needed, and copies it to tftp servers.'''
+
+    def __init__(self, fname, servers):
+        super(Image, self).__init__(name="stage %s" % fname)
+        self.daemon = True
+        self.fname = fname
+        self.servers = servers
+        self.local = None
+        # tftp server -> file name relative to /tftpboot
+        self.remote = {}
+        self.error = None
+
+    def run(self):
+        try:
+            if is_url(self.fname):
+                self.local = download(self.fname)
+            else:
+                self.local = os.path.abspath(self.fname)
+            for server, username, password in self.servers:
+                self.remote[server] = common.cache_to_tftp_server(self.local, server, username, password)
+        except Exception as e:
+            self.error = e
+
+
+def stage(fnames, servers):
+    '''
+    Start staging files or urls, skipping those staged already. servers
+    is a list of (tftp server, username, password) to copy them to.
+    '''
+    with lock:
+        for fname in fnames:
+            if fname and fname not in images:
+                images[fname] = Image(fname, servers)
+                images[fname].start()
+
+
+def tftp_name(fname, server, username, password):
+    '''
+    Wait for the staging of fname, and return its name on the tftp server
+    relative to /tftpboot, or None if it was not staged or staging failed.
+    '''
+    with lock:
+        img = images.get(fname)
+    if img is None:
+        return None
+    img.join()
+    if img.error is not None:
+        print(img.error)
+        common.print_bold("Unable to stage %s" % fname)
+        return None
+    if server not in img.remote:
+        return common.cache_to_tftp_server(img.local, server, username, password)
+    return img.remote[server]
+
+
+def local_name(fname):
+    '''
+    Wait for the staging of fname, and return the name of a local copy
+    of it, downloading it first if it was not staged.
+    '''
+    with lock:
+        img = images.get(fname)
+    if img is not None:
+        img.join()
+        if img.local is not None:
+            return img.local
+    if is_url(fname):
+        return download(fname)
+    return os.path.abspath(fname)
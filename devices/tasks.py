@@ -0,0 +1,216 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Wait for output of several devices at once, from one thread.
+
+A task is a generator. It yields what it waits for, and gets back what
+that returns when ready:
+
+  def iperf_client(dev):
+      dev.sendline('iperf -c 192.168.0.1')
+      yield dev.expect_task('Bytes([^M]*)Mbits', timeout=90)
+      rate = float(dev.match.group(1))
+      yield dev.expect_task(dev.prompt)
+      raise tasks.Return(rate)
+
+  def cpu_usage(dev):
+      r = yield dev.run_task('mpstat 10 1')
+      raise tasks.Return(r.output)
+
+  rate, cpu = tasks.gather(iperf_client(lan), cpu_usage(board))
+
+A task may yield:
+  * device.expect_task(pattern, timeout), returns the index of the pattern
+    found, and sets device.match, before and after like expect(). It is
+    recorded and checked for crashes like expect() too.
+  * device.run_task(cmd, ...), or any other task, returns its result
+  * tasks.Sleep(seconds)
+
+Sending is not waited for, use sendline() and sendcontrol() as usual.
+Tasks end with "raise tasks.Return(value)", as generators in Python 2
+cannot return a value. Only one task at a time may read from a device.
+'''
+
+import select
+import sys
+import time
+import types
+
+import pexpect
+
+import expect_trace
+import prompts
+
+
+class Return(Exception):
+    '''Raised by a task to return a value.'''
+
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+class Expect(object):
+    '''Wait for output of a device matching a pattern.'''
+
+    def __init__(self, device, pattern, timeout=-1):
+        if timeout == -1:
+            timeout = device.timeout
+        self.device = device
+        self.pattern = pattern
+        self.start = time.time()
+        # the task waiting, for expect_trace.py
+        self.frame = expect_trace.caller(1)
+        self.deadline = None if timeout is None else self.start + timeout
+        if isinstance(pattern, prompts.Prompt) and pattern:
+            self.searcher = prompts.PromptSearcher(pattern)
+        else:
+            self.searcher = pexpect.searcher_re(device.compile_pattern_list(pattern))
+
+    def fileno(self):
+        return self.device.child_fd
+
+    def poll(self):
+        '''
+        Search output read so far, and output ready to be read. Return
+        the index of the pattern found, or None to keep waiting.
+        '''
+        try:
+            # a timeout of 0 reads what is ready, without waiting
+            index = self.device.expect_loop(self.searcher, 0)
+        except pexpect.TIMEOUT:
+            if self.deadline is None or time.time() < self.deadline:
+                return None
+            if self.searcher.timeout_index >= 0:
+                return self.found(self.searcher.timeout_index)
+            self.failed()
+            raise pexpect.TIMEOUT("Timeout waiting for %r" % (self.pattern,))
+        except pexpect.EOF:
+            self.failed()
+            raise
+        return self.found(index)
+
+    def found(self, index):
+        '''Finish as BaseDevice.expect() does.'''
+        if isinstance(self.searcher, prompts.PromptSearcher):
+            self.device.matched_prompt = index
+        expect_trace.record(self.device, self.pattern, self.start, self.frame)
+        return index
+
+    def failed(self):
+        expect_trace.record(self.device, self.pattern, self.start, self.frame)
+        self.device.detect_fatal_error()
+
+
+class Sleep(object):
+    '''Wait a number of seconds.'''
+
+    def __init__(self, seconds):
+        self.deadline = time.time() + seconds
+
+    def fileno(self):
+        return None
+
+    def poll(self):
+        if time.time() < self.deadline:
+            return None
+        return True
+
+
+class Task(object):
+    '''A running task, and the tasks it is waiting for.'''
+
+    def __init__(self, gen):
+        self.stack = [gen]
+        self.waiting = None
+        self.value = None
+        self.exc_info = None
+        self.done = False
+        self.result = None
+
+    def step(self):
+        '''Run the task until it has to wait. Return True if it ran at all.'''
+        ran = False
+        while not self.done:
+            if self.waiting is not None:
+                try:
+                    value = self.waiting.poll()
+                except Exception:
+                    self.exc_info = sys.exc_info()
+                else:
+                    if value is None:
+                        return ran
+                    self.value = value
+                self.waiting = None
+            ran = True
+            self.resume()
+        return ran
+
+    def resume(self):
+        '''Send the last result, or throw the last error, into the task.'''
+        gen = self.stack[-1]
+        value, exc_info = self.value, self.exc_info
+        self.value = self.exc_info = None
+        try:
+            if exc_info is not None:
+                waiting = gen.throw(*exc_info)
+            else:
+                waiting = gen.send(value)
+        except Return as e:
+            return self.finish(e.value)
+        except StopIteration:
+            return self.finish(None)
+        except Exception:
+            # errors of the outermost task go to the caller of gather()
+            if len(self.stack) == 1:
+                raise
+            self.stack.pop()
+            self.exc_info = sys.exc_info()
+            return
+        if isinstance(waiting, types.GeneratorType):
+            self.stack.append(waiting)
+        elif hasattr(waiting, 'poll'):
+            self.waiting = waiting
+        else:
+            self.exc_info = (TypeError, TypeError("A task cannot wait for %r" % (waiting,)), None)
+
+    def finish(self, value):
+        self.stack.pop()
+        if self.stack:
+            self.value = value
+        else:
+            self.done = True
+            self.result = value
+
+
+def gather(*gens):
+    '''
+    Run tasks until all of them are done, and return a list of their
+    results. An error in one task stops all of them and is raised here.
+    '''
+    running = [Task(g) for g in gens]
+    while True:
+        waiting = [t for t in running if not t.done]
+        if not waiting:
+            return [t.result for t in running]
+        ran = False
+        for t in waiting:
+            ran = t.step() or ran
+        if ran:
+            continue
+        # nothing is ready, sleep until some output is, or time is up
+        fds = [t.waiting.fileno() for t in waiting]
+        fds = [fd for fd in fds if fd is not None]
+        deadlines = [t.waiting.deadline for t in waiting if t.waiting.deadline is not None]
+        timeout = None
+        if deadlines:
+            timeout = max(0, min(deadlines) - time.time())
+        if fds:
+            select.select(fds, [], [], timeout)
+        elif timeout is not None:
+            time.sleep(timeout)
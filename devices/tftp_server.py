@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+A small tftp server, to use instead of tftpd-hpa.
+
+U-Boot transfers large images slowly with the default 512 byte blocks,
+one block per round trip. This server negotiates the options U-Boot and
+other clients ask for:
+
+  blksize     bytes per block, up to 65464 (RFC 2348)
+  windowsize  blocks sent before waiting for an ack (RFC 7440)
+  tsize       size of the file (RFC 2349)
+  timeout     seconds before a block is sent again (RFC 2349)
+
+All transfers are served by one thread, waiting on their sockets with
+select(). Files are mapped in memory, so blocks are sliced from the
+page cache instead of being read one at a time. When a transfer ends,
+its speed and number of blocks sent again are printed, and appended as
+a line of json to a stats file:
+
+  ./devices/tftp_server.py --root /srv/tftp --stats /tmp/tftp_stats.jsonl
+
+The file is written by the wan device when config.builtin_tftp_server
+is set, see DebianBox.start_tftp_server().
+
+Like tftpd-hpa, the server is read-only unless started with --write.
+Even then, existing files are never written over.
+'''
+
+import errno
+import json
+import mmap
+import os
+import select
+import socket
+import struct
+import time
+
+RRQ, WRQ, DATA, ACK, ERROR, OACK = range(1, 7)
+
+# Error codes
+NOT_DEFINED, NOT_FOUND, ACCESS_VIOLATION, DISK_FULL, ILLEGAL_OPERATION, UNKNOWN_TID, \
+    FILE_EXISTS, NO_SUCH_USER, BAD_OPTIONS = range(9)
+
+# Times a block or window is sent again before a transfer is given up
+retries = 5
+
+# Seconds before sending again, unless the client asks otherwise
+default_timeout = 1.0
+
+
+def error_packet(code, msg):
+    return struct.pack('!HH', ERROR, code) + msg.encode() + b'\0'
+
+
+def parse_request(packet):
+    '''Return (file name, mode, {option: value}) of a read or write request.'''
+    fields = packet[2:].split(b'\0')
+    fname = fields[0].decode()
+    mode = fields[1].decode().lower()
+    options = {}
+    for name, value in zip(fields[2:-1:2], fields[3:-1:2]):
+        options[name.decode().lower()] = value.decode()
+    return fname, mode, options
+
+
+def clamp(value, low, high):
+    return max(low, min(high, int(value)))
+
+
+class Transfer(object):
+    '''One read or write of a file, from its own socket.'''
+
+    def __init__(self, server, peer, fname, options):
+        self.server = server
+        self.peer = peer
+        self.fname = fname
+        self.blksize = 512
+        self.windowsize = 1
+        self.timeout = default_timeout
+        # options agreed, sent back in an OACK
+        self.agreed = {}
+        if 'blksize' in options:
+            self.blksize = clamp(options['blksize'], 8, 65464)
+            self.agreed['blksize'] = self.blksize
+        if 'timeout' in options:
+            self.timeout = clamp(options['timeout'], 1, 255)
+            self.agreed['timeout'] = self.timeout
+        if 'windowsize' in options and self.kind == 'read':
+            self.windowsize = clamp(options['windowsize'], 1, 65535)
+            self.agreed['windowsize'] = self.windowsize
+        self.start = time.time()
+        self.deadline = self.start + self.timeout
+        self.tries = 0
+        self.retransmits = 0
+        self.nbytes = 0
+        self.done = False
+        self.error = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((server.address, 0))
+
+    def oack(self):
+        return struct.pack('!H', OACK) + b''.join(
+            ('%s\0%s\0' % (k, v)).encode() for k, v in sorted(self.agreed.items()))
+
+    def send(self, packet):
+        self.sock.sendto(packet, self.peer)
+
+    def fail(self, code, msg):
+        self.send(error_packet(code, msg))
+        self.error = msg
+        self.done = True
+
+    def receive(self):
+        packet, peer = self.sock.recvfrom(65536)
+        if peer != self.peer:
+            self.sock.sendto(error_packet(UNKNOWN_TID, "Unknown transfer ID"), peer)
+            return
+        opcode, = struct.unpack('!H', packet[:2])
+        if opcode == ERROR:
+            self.error = "Error from client: %r" % packet[4:-1]
+            self.done = True
+            return
+        self.handle(opcode, struct.unpack('!H', packet[2:4])[0], packet[4:])
+
+    def timed_out(self):
+        self.tries += 1
+        if self.tries > retries:
+            self.fail(NOT_DEFINED, "Timed out")
+            return
+        self.resend()
+
+    def stats(self):
+        seconds = max(time.time() - self.start, 0.001)
+        return {'file': self.fname,
+                'peer': "%s:%s" % self.peer,
+                'kind': self.kind,
+                'bytes': self.nbytes,
+                'seconds': round(seconds, 3),
+                'kBps': round(self.nbytes / 1024.0 / seconds, 1),
+                'blksize': self.blksize,
+                'windowsize': self.windowsize,
+                'retransmits': self.retransmits,
+                'error': self.error}
+
+    def close(self):
+        self.sock.close()
+
+
+class ReadTransfer(Transfer):
+    '''Sends a file, a window of blocks at a time.'''
+
+    kind = 'read'
+
+    def __init__(self, server, peer, fname, path, options):
+        self.f = open(path, 'rb')
+        try:
+            super(ReadTransfer, self).__init__(server, peer, fname, options)
+        except ValueError:
+            self.f.close()
+            raise
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.data = b''
+        if self.size:
+            self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        if 'tsize' in options:
+            self.agreed['tsize'] = self.size
+        # a last block shorter than blksize, maybe empty, ends the transfer
+        self.blocks = self.size // self.blksize + 1
+        # blocks acked so far, counted past the 16 bit block numbers
+        self.acked = 0
+        self.started = not self.agreed
+        self.resend()
+
+    def send_block(self, n):
+        self.send(struct.pack('!HH', DATA, n & 0xffff) +
+                  self.data[(n - 1) * self.blksize:n * self.blksize])
+
+    def resend(self):
+        '''Send the OACK, or the window of blocks after the last acked.'''
+        if not self.started:
+            self.send(self.oack())
+        else:
+            for n in range(self.acked + 1, min(self.acked + self.windowsize, self.blocks) + 1):
+                self.send_block(n)
+        self.deadline = time.time() + self.timeout
+
+    def timed_out(self):
+        if self.started:
+            self.retransmits += min(self.windowsize, self.blocks - self.acked)
+        super(ReadTransfer, self).timed_out()
+
+    def handle(self, opcode, block, payload):
+        if opcode != ACK:
+            self.fail(ILLEGAL_OPERATION, "Expected an ACK")
+            return
+        if not self.started:
+            if block == 0:
+                self.started = True
+                self.tries = 0
+                self.resend()
+            return
+        # block numbers wrap around at 65536
+        n = self.acked + ((block - self.acked) & 0xffff)
+        if not self.acked < n <= min(self.acked + self.windowsize, self.blocks):
+            # an old ack, answering it would send blocks twice
+            return
+        self.acked = n
+        self.tries = 0
+        self.nbytes = min(self.acked * self.blksize, self.size)
+        if self.acked == self.blocks:
+            self.done = True
+            return
+        self.resend()
+
+    def close(self):
+        if self.size:
+            self.data.close()
+        self.f.close()
+        super(ReadTransfer, self).close()
+
+
+class WriteTransfer(Transfer):
+    '''Receives a new file, one block per ack, e.g. crash dumps from U-Boot.'''
+
+    kind = 'write'
+
+    def __init__(self, server, peer, fname, path, options):
+        if os.path.exists(path) or os.path.exists(path + '.part'):
+            raise IOError(errno.EEXIST, "File exists")
+        super(WriteTransfer, self).__init__(server, peer, fname, options)
+        if 'tsize' in options:
+            self.agreed['tsize'] = options['tsize']
+        self.path = path
+        try:
+            self.f = open(path + '.part', 'wb')
+        except (IOError, OSError):
+            self.sock.close()
+            raise
+        self.received = 0
+        self.resend()
+
+    def resend(self):
+        '''Send the OACK, or the ack of the last block received.'''
+        if self.agreed and self.received == 0:
+            self.send(self.oack())
+        else:
+            self.send(struct.pack('!HH', ACK, self.received & 0xffff))
+        self.deadline = time.time() + self.timeout
+
+    def handle(self, opcode, block, payload):
+        if opcode != DATA:
+            self.fail(ILLEGAL_OPERATION, "Expected DATA")
+            return
+        if block != (self.received + 1) & 0xffff:
+            if block == self.received & 0xffff:
+                # our ack was lost
+                self.retransmits += 1
+                self.resend()
+            return
+        self.f.write(payload)
+        self.received += 1
+        self.nbytes += len(payload)
+        self.tries = 0
+        if len(payload) < self.blksize:
+            self.f.close()
+            if os.path.exists(self.path):
+                # written by another transfer meanwhile
+                os.remove(self.path + '.part')
+                self.fail(FILE_EXISTS, "File exists")
+                return
+            os.rename(self.path + '.part', self.path)
+            self.done = True
+        self.resend()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+            os.remove(self.path + '.part')
+        super(WriteTransfer, self).close()
+
+
+class Server(object):
+    '''Serves files under directory root, to any number of clients at once.'''
+
+    def __init__(self, root, address='', port=69, stats=None, allow_write=False):
+        self.root = os.path.realpath(root)
+        self.address = address
+        self.stats = stats
+        self.allow_write = allow_write
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((address, port))
+        # socket -> Transfer
+        self.transfers = {}
+
+    def path(self, fname):
+        '''Return the local path of fname, or None if it is outside of root.'''
+        path = os.path.realpath(os.path.join(self.root, fname.lstrip('/')))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def request(self):
+        packet, peer = self.sock.recvfrom(65536)
+        try:
+            opcode, = struct.unpack('!H', packet[:2])
+            if opcode not in (RRQ, WRQ):
+                raise ValueError("Not a request")
+            fname, mode, options = parse_request(packet)
+        except (ValueError, IndexError, struct.error):
+            self.sock.sendto(error_packet(ILLEGAL_OPERATION, "Bad request"), peer)
+            return
+        path = self.path(fname)
+        try:
+            if path is None:
+                raise IOError(errno.EACCES, "Outside of %s" % self.root)
+            if opcode == RRQ:
+                t = ReadTransfer(self, peer, fname, path, options)
+            elif not self.allow_write:
+                raise IOError(errno.EACCES, "Writing not allowed")
+            else:
+                t = WriteTransfer(self, peer, fname, path, options)
+        except (IOError, OSError) as e:
+            code = {errno.ENOENT: NOT_FOUND, errno.EEXIST: FILE_EXISTS}.get(e.errno, ACCESS_VIOLATION)
+            self.sock.sendto(error_packet(code, str(e.strerror)), peer)
+            return
+        except ValueError:
+            self.sock.sendto(error_packet(BAD_OPTIONS, "Bad option value"), peer)
+            return
+        self.transfers[t.sock] = t
+
+    def finish(self, t):
+        del self.transfers[t.sock]
+        t.close()
+        s = t.stats()
+        print("%(kind)s %(file)s by %(peer)s: %(bytes)s bytes in %(seconds)s s (%(kBps)s kB/s), "
+              "blksize %(blksize)s, windowsize %(windowsize)s, %(retransmits)s retransmits" % s +
+              (", failed: %s" % s['error'] if s['error'] else ""))
+        if self.stats:
+            with open(self.stats, 'a') as f:
+                f.write(json.dumps(s) + "\n")
+
+    def serve_once(self, timeout=None):
+        '''Wait for packets or timeouts, at most timeout seconds, and handle them.'''
+        now = time.time()
+        wait = timeout
+        for t in self.transfers.values():
+            left = max(0, t.deadline - now)
+            wait = left if wait is None else min(wait, left)
+        ready = select.select([self.sock] + list(self.transfers), [], [], wait)[0]
+        for sock in ready:
+            if sock is self.sock:
+                self.request()
+            elif sock in self.transfers:
+                self.transfers[sock].receive()
+        now = time.time()
+        for t in list(self.transfers.values()):
+            if not t.done and now >= t.deadline:
+                t.timed_out()
+            if t.done:
+                self.finish(t)
+
+    def serve_forever(self):
+        while True:
+            self.serve_once()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve files over tftp, with large blocks and windows.')
+    parser.add_argument('--root', default='/srv/tftp', help='directory to serve')
+    parser.add_argument('--address', default='', help='address to listen on')
+    parser.add_argument('--port', type=int, default=69, help='port to listen on')
+    parser.add_argument('--stats', help='append a line of json per transfer to this file')
+    parser.add_argument('--write', action='store_true', help='accept new files, never overwriting any')
+    args = parser.parse_args()
+
+    Server(args.root, args.address, args.port, args.stats, args.write).serve_forever()
@@ -0,0 +1,184 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Copy files between this computer and the board.
+
+The board is usually only reachable from the device on its LAN port,
+so files travel in two hops: board <-> LAN device, over scp or nc, and
+LAN device <-> this computer, over ssh. Without a LAN device, or if
+both fail, files are typed through the console in base64, which is
+slow but always works.
+
+Every copy is checked with md5, and its speed is printed:
+
+  local = board.fetch('/tmp/crash.core')
+  board.push('my_script.sh', '/tmp/my_script.sh')
+'''
+
+import hashlib
+import os
+import pipes
+import random
+import tempfile
+import time
+
+import pexpect
+
+import common
+
+# Address of the board seen from its LAN device
+board_ip = '192.168.1.1'
+
+# Ways to copy a file, in the order they are tried
+channels = ['scp', 'nc', 'console']
+
+# Bytes of a file typed or printed at once, over the console
+console_chunk = 512
+console_fetch_chunk = 64 * 1024
+
+
+def md5_file(fname):
+    h = hashlib.md5()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def md5_remote(dev, path):
+    return dev.run("md5sum %s" % path, check=True).output.split()[0]
+
+
+def report(what, size, seconds, channel):
+    seconds = max(seconds, 0.001)
+    common.print_bold("%s: %s bytes in %.1f s over %s (%.1f kB/s)" %
+                      (what, size, seconds, channel, size / 1024.0 / seconds))
+
+
+def host_ssh(dev, remote_cmd, before="", after="", timeout=600):
+    '''
+    Run a command on a device over a new ssh connection from this
+    computer, with shell redirections before and after the ssh command.
+    '''
+    cmd = "%s ssh -x -p %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null %s@%s %s %s" % \
+        (before, dev.port, dev.username, dev.name, pipes.quote(remote_cmd), after)
+    p = pexpect.spawn('/bin/bash', ['-c', cmd], timeout=timeout)
+    if p.expect(["assword:", pexpect.EOF]) == 0:
+        p.sendline(dev.password)
+        p.expect(pexpect.EOF)
+    p.close()
+    if p.exitstatus != 0:
+        raise Exception("'%s' failed with exit status %s" % (cmd, p.exitstatus))
+
+
+def board_to_lan(board, lan, path, tmp, channel, timeout):
+    if channel == 'scp':
+        lan.run("scp -o BatchMode=yes root@%s:%s %s" % (board_ip, path, tmp), timeout=timeout, check=True)
+    elif channel == 'nc':
+        port = random.randint(20000, 30000)
+        board.run("nc -l -p %d < %s &" % (port, path))
+        try:
+            lan.run("sleep 1; nc %s %d > %s" % (board_ip, port, tmp), timeout=timeout, check=True)
+        finally:
+            board.run("kill $! 2>/dev/null")
+
+
+def lan_to_board(board, lan, tmp, path, channel, timeout):
+    if channel == 'scp':
+        lan.run("scp -o BatchMode=yes %s root@%s:%s" % (tmp, board_ip, path), timeout=timeout, check=True)
+    elif channel == 'nc':
+        port = random.randint(20000, 30000)
+        board.run("nc -l -p %d > %s &" % (port, path))
+        try:
+            # netcat flavours differ in how they end once input is sent
+            lan.run("sleep 1; nc -q 1 %s %d < %s || nc -N %s %d < %s" %
+                    (board_ip, port, tmp, board_ip, port, tmp), timeout=timeout, check=True)
+        finally:
+            board.run("kill $! 2>/dev/null")
+
+
+def console_fetch(board, path, local, timeout):
+    size = int(board.run("wc -c < %s" % path, check=True).output.split()[-1])
+    with open(local, 'wb') as f:
+        for i in range(0, size, console_fetch_chunk):
+            r = board.run("dd if=%s bs=%d skip=%d count=1 2>/dev/null | base64" %
+                          (path, console_fetch_chunk, i // console_fetch_chunk), timeout=timeout, check=True)
+            f.write("".join(r.output.split()).decode('base64'))
+
+
+def console_push(board, local, path, timeout):
+    board.run("rm -f %s" % path, check=True)
+    cmds = []
+    with open(local, 'rb') as f:
+        for block in iter(lambda: f.read(console_chunk), b''):
+            cmds.append("echo %s | base64 -d >> %s" % ("".join(block.encode('base64').split()), path))
+    board.run_batch(cmds + ["touch %s" % path], timeout=timeout)
+
+
+def fetch(board, path, local=None, lan=None, timeout=600):
+    '''
+    Copy file path on the board to this computer, by default to a new
+    temporary file. Return the name of the local file.
+    '''
+    if local is None:
+        fd, local = tempfile.mkstemp(prefix='bft-', suffix='-' + os.path.basename(path))
+        os.close(fd)
+    md5 = md5_remote(board, path)
+    tmp = "/tmp/bft-%06x" % random.getrandbits(24)
+    for channel in channels:
+        if channel != 'console' and not lan:
+            continue
+        start = time.time()
+        try:
+            if channel == 'console':
+                console_fetch(board, path, local, timeout)
+            else:
+                board_to_lan(board, lan, path, tmp, channel, timeout)
+                host_ssh(lan, "cat %s" % tmp, after="> %s" % pipes.quote(local), timeout=timeout)
+        except Exception as e:
+            print(e)
+            common.print_bold("Unable to fetch %s over %s" % (path, channel))
+            continue
+        finally:
+            if channel != 'console':
+                lan.run("rm -f %s" % tmp)
+        if md5_file(local) != md5:
+            common.print_bold("Checksum of %s fetched over %s does not match" % (path, channel))
+            continue
+        report("Fetched %s" % path, os.path.getsize(local), time.time() - start, channel)
+        return local
+    raise Exception("Unable to fetch %s from board" % path)
+
+
+def push(board, local, path, lan=None, timeout=600):
+    '''Copy file local on this computer to path on the board.'''
+    md5 = md5_file(local)
+    tmp = "/tmp/bft-%06x" % random.getrandbits(24)
+    for channel in channels:
+        if channel != 'console' and not lan:
+            continue
+        start = time.time()
+        try:
+            if channel == 'console':
+                console_push(board, local, path, timeout)
+            else:
+                host_ssh(lan, "cat > %s" % tmp, before="cat %s |" % pipes.quote(local), timeout=timeout)
+                lan_to_board(board, lan, tmp, path, channel, timeout)
+        except Exception as e:
+            print(e)
+            common.print_bold("Unable to push %s over %s" % (path, channel))
+            continue
+        finally:
+            if channel != 'console':
+                lan.run("rm -f %s" % tmp)
+        if md5_remote(board, path) != md5:
+            common.print_bold("Checksum of %s pushed over %s does not match" % (path, channel))
+            continue
+        report("Pushed %s" % path, os.path.getsize(local), time.time() - start, channel)
+        return
+    raise Exception("Unable to push %s to board" % local)
@@ -5,8 +5,11 @@
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
 
+import json
 import os
+import time
 
+import junitxml
 from termcolor import cprint
 
 def print_bold(msg):
@@ -16,41 +19,173 @@ def print_board_info(x):
     for key in sorted(x):
         print_bold("  %s: %s" % (key, x[key]))
 
+def test_record(x):
+    '''Return dictionary describing the result of a test.'''
+    message = None
+    try:
+        # Use only first line of docstring result message
+        message = x.__doc__.split('\n')[0]
+    except:
+        print_bold("WARN: Please add docstring to %s." % x)
+    try:
+        message = x.result_message
+    except:
+        pass
+    if hasattr(x, 'long_result_message'):
+        long_message = x.long_result_message
+    else:
+        long_message = ""
+    return {"name": x.__class__.__name__,
+            "message": message,
+            "long_message": long_message,
+            "grade": getattr(x, 'result_grade', None),
+            "duration": getattr(x, 'duration', None),
+            "logged": getattr(x, 'logged', {}),
+            "kibana_name": getattr(x, 'override_kibana_name', x.__class__.__name__),
+            "suite_index": getattr(x, 'suite_index', None)}
+
+class StreamingResult(junitxml.JUnitXmlResult):
+    '''
+    Junit xml result that also appends a json record of every test to a
+    file as soon as the test ends, one record per line. Records include
+    the range of the console log written during the test, as byte offsets.
+    '''
+    def __init__(self, stream, records_name, console=None, console_base=0):
+        super(StreamingResult, self).__init__(stream)
+        self.records_name = records_name
+        self.console = console
+        # size of console log already written by an earlier run
+        self.console_base = console_base
+        self.console_start = None
+
+    def console_offset(self):
+        try:
+            return self.console_base + len(self.console.log)
+        except:
+            return None
+
+    def startTest(self, test):
+        super(StreamingResult, self).startTest(test)
+        self.console_start = self.console_offset()
+        from devices import expect_trace
+        expect_trace.test = test.__class__.__name__
+
+    def stopTest(self, test):
+        super(StreamingResult, self).stopTest(test)
+        r = test_record(test)
+        r['console_start'] = self.console_start
+        r['console_end'] = self.console_offset()
+        # errors found in the console during the test, see devices/error_detect.py
+        r['console_events'] = [(self.console_base + o, name, text)
+                               for o, name, text in getattr(self.console, 'error_events', [])
+                               if r['console_start'] is not None and
+                               r['console_start'] <= self.console_base + o < r['console_end']]
+        r['time'] = time.time()
+        r['boot_id'] = getattr(self.console, 'boot_id', None)
+        try:
+            with open(self.records_name, 'a') as f:
+                f.write(json.dumps(r, sort_keys=True, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            print(e)
+            print_bold("Unable to record result of %s." % r['name'])
+
+def read_test_records(fname):
+    '''Return list of test records written by StreamingResult.'''
+    records = []
+    try:
+        f = open(fname)
+    except IOError:
+        return records
+    for line in f:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # last line may be cut short by a crash
+            pass
+    return records
+
+# Grades of tests that do not need to run again when resuming
+final_grades = ["OK", "Unexp OK", "FAIL", "Exp FAIL"]
+
+def write_run_state(config, test_names):
+    '''Save what is needed to resume this run later, see read_run_state.'''
+    state = {'board': config.board['station'],
+             'test_suite': config.TEST_SUITE,
+             'tests': test_names,
+             'wan_proto': config.WAN_PROTO,
+             'packages': getattr(config, 'INSTALL_PKGS', ""),
+             'images': {'UBOOT': config.UBOOT,
+                        'KERNEL': config.KERNEL,
+                        'ROOTFS': config.ROOTFS,
+                        'META_BUILD': config.META_BUILD}}
+    json.dump(state, open(os.path.join(config.output_dir, 'run_state.json'), 'w'),
+              indent=4, sort_keys=True)
+
+def read_run_state(config, output_dir):
+    '''Configure to run the same tests on the same board as an earlier run.'''
+    output_dir = os.path.abspath(output_dir) + os.sep
+    try:
+        state = json.load(open(os.path.join(output_dir, 'run_state.json')))
+    except Exception as e:
+        print(e)
+        print_bold("Unable to find a run to resume in %s" % output_dir)
+        raise
+    config.output_dir = output_dir
+    config.BOARD_NAMES = [state['board']]
+    config.TEST_SUITE = state['test_suite']
+    config.TEST_NAMES = state['tests']
+    config.EXTRA_TESTS = None
+    config.WAN_PROTO = state['wan_proto']
+    config.INSTALL_PKGS = state.get('packages', "")
+    for k, v in state['images'].items():
+        setattr(config, k, v)
+
+def write_junit_xml(records, fname):
+    '''Write junit xml results made from test records.'''
+    import xml.etree.ElementTree as ET
+    suite = ET.Element('testsuite')
+    counts = {'errors': 0, 'failures': 0, 'tests': 0}
+    total_time = 0.0
+    for r in records:
+        case = ET.SubElement(suite, 'testcase', classname=r['name'], name='testWrapper',
+                             time='%.3f' % (r['duration'] or 0))
+        counts['tests'] += 1
+        total_time += r['duration'] or 0
+        if r['grade'] == "FAIL":
+            counts['failures'] += 1
+            ET.SubElement(case, 'failure').text = r['message'] or ""
+        elif r['grade'] in ("SKIP", None):
+            ET.SubElement(case, 'skip')
+    for k, v in counts.items():
+        suite.set(k, str(v))
+    suite.set('name', '')
+    suite.set('time', '%.3f' % total_time)
+    ET.ElementTree(suite).write(fname)
+
 def process_test_results(raw_test_results):
+    '''
+    Summarize results, given either tests or records of tests
+    (see test_record).
+    '''
     full_results = {'test_results': [],
                     'tests_pass': 0,
                     'tests_fail': 0,
                     'tests_skip': 0,
                     'tests_total': 0,
                     }
-    for i, x in enumerate(raw_test_results):
-        message = None
-        name = x.__class__.__name__
-        grade = None
-        try:
-            grade = x.result_grade
-        except:
-            pass
+    for x in raw_test_results:
+        if not isinstance(x, dict):
+            x = test_record(x)
+        grade = x['grade']
         if grade == "OK" or grade == "Unexp OK":
             full_results['tests_pass'] += 1
         elif grade == "FAIL" or grade == "Exp FAIL":
             full_results['tests_fail'] += 1
         elif grade == "SKIP" or grade is None:
             full_results['tests_skip'] += 1
-        try:
-            # Use only first line of docstring result message
-            message = x.__doc__.split('\n')[0]
-        except:
-            print_bold("WARN: Please add docstring to %s." % x)
-        try:
-            message = x.result_message
-        except:
-            pass
-        if hasattr(x, 'long_result_message'):
-            long_message = x.long_result_message
-        else:
-            long_message = ""
-        full_results['test_results'].append({"name": name, "message": message, "long_message": long_message, "grade": grade})
+        full_results['test_results'].append({"name": x['name'], "message": x['message'], "long_message": x['long_message'], "grade": grade})
     full_results['tests_total'] = len(raw_test_results)
     return full_results
 
@@ -0,0 +1,291 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Run one test suite on several boards at the same time.
+
+The suite is split into shards, one per board. Every shard starts
+with the tests that boot the board (e.g. RootFSBootTest), then gets
+its share of the remaining tests, balanced by how long each test took
+in earlier runs (see timings.py). Each board is driven by its own
+worker process writing results into a sub-directory of the output
+directory, and the per-board results are merged into one report.
+'''
+
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import library
+import timings
+from library import print_bold
+
+# Tests that bring up a board, every shard has to start with these
+boot_tests = ['RootFSBootTest']
+
+
+def test_name(t):
+    '''Suites may contain test names or test classes.'''
+    return getattr(t, '__name__', t)
+
+
+def suite_tests(config):
+    '''Return the full list of tests that would run on a single board.'''
+    import testsuites
+    names = list(testsuites.list_tests[config.TEST_SUITE])
+    if getattr(config, 'EXTRA_TESTS', None):
+        names += config.EXTRA_TESTS
+    # Nobody is watching the workers, so never stop to interact
+    return [n for n in names if test_name(n) != 'Interact']
+
+
+def test_dependencies():
+    '''
+    Return dictionary of test name -> names of tests it depends on, as
+    declared by "depends_on = [...]" in the test class. The registry of
+    tests is used rather than importing them, because importing tests
+    binds them to devices before any board is connected.
+    '''
+    import tests
+    return dict((name, info['depends_on']) for name, info in tests.registry().items()
+                if info['depends_on'] is not None)
+
+
+def group_tests(names, deps):
+    '''
+    Group test indexes that must run on the same board. A test is
+    kept with the closest earlier test it depends on.
+    '''
+    group_of = list(range(len(names)))
+    def find(i):
+        while group_of[i] != i:
+            i = group_of[i]
+        return i
+    for i, n in enumerate(names):
+        for d in deps.get(test_name(n), []):
+            for j in range(i - 1, -1, -1):
+                if test_name(names[j]) == d:
+                    group_of[find(i)] = find(j)
+                    break
+    groups = {}
+    for i in range(len(names)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values())
+
+
+def split_tests(names, num_shards, durations={}, default_duration=60, deps={}):
+    '''
+    Split a list of tests into num_shards lists. The leading boot tests
+    are copied into every shard. The rest are grouped by dependencies
+    and handed out longest first, each group going to the shard with
+    the least expected work so far. Tests keep their suite order
+    within a shard.
+    '''
+    prefix = []
+    for n in names:
+        if test_name(n) not in boot_tests:
+            break
+        prefix.append(n)
+    body = names[len(prefix):]
+
+    def cost(group):
+        return sum(durations.get(test_name(body[i]), default_duration) for i in group)
+
+    loads = [0] * num_shards
+    assigned = [[] for i in range(num_shards)]
+    for group in sorted(group_tests(body, deps), key=cost, reverse=True):
+        shard = loads.index(min(loads))
+        loads[shard] += cost(group)
+        assigned[shard] += group
+
+    shards = []
+    for i in range(num_shards):
+        # Don't bother a board that would only boot
+        if not assigned[i] and body:
+            continue
+        shards.append(list(prefix) + [body[j] for j in sorted(assigned[i])])
+    return shards
+
+
+def worker(config, target, name, tests, output_dir):
+    '''Run one shard of tests on one board, in a child process.'''
+    try:
+        os.makedirs(output_dir)
+    except:
+        pass
+    # Keep console output of each board apart
+    log = open(os.path.join(output_dir, 'bft.log'), 'w')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    config.BOARD_NAMES = [name]
+    config.TEST_NAMES = tests
+    config.EXTRA_TESTS = None
+    config.batch = True
+    config.output_dir = output_dir
+    target(config)
+
+
+def run(config, target):
+    '''
+    Run the selected suite across up to config.parallel boards, calling
+    target(config) in one worker process per board. If a board cannot
+    be connected to, its share of the tests moves to a spare board.
+    Return a process exit code.
+    '''
+    os.environ['TEST_START_TIME'] = datetime.datetime.now().strftime("%s")
+    names = suite_tests(config)
+    spare = list(config.BOARD_NAMES)
+
+    # Use how long tests took before on this type of board
+    board_type = config.boardfarm_config[spare[0]]['board_type']
+    t = timings.TestTimings()
+    default_duration = t.typical(board_type)
+    durations = dict((test_name(n), t.get(board_type, test_name(n), default_duration)) for n in names)
+    shards = split_tests(names, min(config.parallel, len(spare)),
+                         durations=durations, default_duration=default_duration,
+                         deps=test_dependencies())
+    print_bold("Running %s tests across %s boards:" % (len(names), len(shards)))
+    for tests in shards:
+        print_bold("  expect about %d minutes for: %s" % (sum(durations[test_name(n)] for n in tests) / 60,
+                                                         ", ".join(test_name(n) for n in tests)))
+
+    results_dirs = []
+    not_run = []
+    running = {}
+    pending = list(shards)
+    while pending or running:
+        # Start a worker for every shard we have a board for
+        while pending and spare:
+            tests = pending.pop(0)
+            name = spare.pop(0)
+            output_dir = os.path.join(config.output_dir, name, '')
+            print_bold("  %s: %s" % (name, ", ".join(test_name(t) for t in tests)))
+            p = multiprocessing.Process(target=worker,
+                                        args=(config, target, name, tests, output_dir))
+            p.start()
+            running[p] = (name, tests, output_dir)
+        if pending and not spare and not running:
+            break
+        time.sleep(1)
+        for p in list(running):
+            if p.is_alive():
+                continue
+            name, tests, output_dir = running.pop(p)
+            if p.exitcode == 2:
+                print_bold("Unable to use board %s, moving its tests." % name)
+                pending.append(tests)
+            else:
+                print_bold("Board %s finished (exit code %s)." % (name, p.exitcode))
+                results_dirs.append(output_dir)
+    for tests in pending:
+        not_run += tests
+    os.environ['TEST_END_TIME'] = datetime.datetime.now().strftime("%s")
+
+    merge_results(results_dirs, config.output_dir, not_run)
+    return 0 if results_dirs else 2
+
+
+def merge_json_results(results_dirs, not_run=[]):
+    '''Combine test_results.json of each board into one dictionary.'''
+    full_results = {'test_results': [],
+                    'tests_pass': 0,
+                    'tests_fail': 0,
+                    'tests_skip': 0,
+                    'tests_total': 0,
+                    }
+    for d in results_dirs:
+        try:
+            data = json.load(open(os.path.join(d, 'test_results.json')))
+        except Exception as e:
+            print(e)
+            print_bold("No results found in %s" % d)
+            continue
+        station = os.path.basename(os.path.normpath(d))
+        for r in data['test_results']:
+            r['station'] = station
+            full_results['test_results'].append(r)
+        for k in ('tests_pass', 'tests_fail', 'tests_skip', 'tests_total'):
+            full_results[k] += data.get(k, 0)
+    for t in not_run:
+        full_results['test_results'].append({"name": test_name(t),
+                                             "message": "No board available to run test",
+                                             "long_message": "",
+                                             "grade": "SKIP"})
+        full_results['tests_skip'] += 1
+        full_results['tests_total'] += 1
+    return full_results
+
+
+def merge_xml_results(results_dirs, output_name):
+    '''Combine junit test_results.xml of each board into one file.'''
+    merged = ET.Element('testsuite')
+    totals = {'errors': 0, 'failures': 0, 'tests': 0}
+    total_time = 0.0
+    for d in results_dirs:
+        try:
+            suite = ET.parse(os.path.join(d, 'test_results.xml')).getroot()
+        except Exception as e:
+            print(e)
+            continue
+        station = os.path.basename(os.path.normpath(d))
+        for k in totals:
+            totals[k] += int(suite.get(k, 0))
+        # boards run at the same time, so wall time is the longest one
+        total_time = max(total_time, float(suite.get('time', 0)))
+        for case in suite:
+            case.set('classname', "%s.%s" % (station, case.get('classname', '')))
+            merged.append(case)
+    for k, v in totals.items():
+        merged.set(k, str(v))
+    merged.set('name', '')
+    merged.set('time', '%.3f' % total_time)
+    ET.ElementTree(merged).write(output_name)
+
+
+def merge_records(results_dirs, output_name):
+    '''Combine per-test records of each board into one file, in order of completion.'''
+    records = []
+    for d in results_dirs:
+        station = os.path.basename(os.path.normpath(d))
+        for r in library.read_test_records(os.path.join(d, 'test_results.jsonl')):
+            r['station'] = station
+            records.append(r)
+    with open(output_name, 'w') as f:
+        for r in sorted(records, key=lambda r: r.get('time')):
+            f.write(json.dumps(r, sort_keys=True) + "\n")
+
+
+def merge_results(results_dirs, output_dir, not_run=[]):
+    '''Write combined json, junit xml and html reports into output_dir.'''
+    full_results = merge_json_results(results_dirs, not_run)
+    json.dump(full_results,
+              open(os.path.join(output_dir, 'test_results.json'), 'w'),
+              indent=4,
+              sort_keys=True)
+    merge_xml_results(results_dirs, os.path.join(output_dir, 'test_results.xml'))
+    merge_records(results_dirs, os.path.join(output_dir, 'test_results.jsonl'))
+    print_bold("Merged results of %s boards into %s" % (len(results_dirs), output_dir))
+    print_bold("Passed %(tests_pass)s, failed %(tests_fail)s, skipped %(tests_skip)s of %(tests_total)s tests." % full_results)
+
+    import make_human_readable
+    try:
+        stations = [os.path.basename(os.path.normpath(d)) for d in results_dirs]
+        title_str = make_human_readable.get_title()
+        make_human_readable.xmlresults_to_html(full_results['test_results'], title=title_str,
+                                output_name=os.path.join(output_dir, "results.html"),
+                                board_info={'station': ", ".join(stations)})
+    except Exception as e:
+        print(e)
+        print("Unable to create HTML results")
+    return full_results
@@ -0,0 +1,152 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+'''
+Reorder a test suite so that tests needing the same board state run
+back to back.
+
+Tests declare the state they need and the state they leave behind:
+
+  class Nmap_WAN(rootfs_boot.RootFSBootTest):
+      requires_state = {'port_forward': False}
+
+  class iPerfReverseTest(iPerfTest):
+      changes_state = {'port_forward': True}
+
+A freshly booted board has every state False. A value of None in
+requires_state means the test does not care. Declarations of base
+classes are inherited, a subclass only lists what differs.
+
+Between tests the planner inserts the cheapest transition test (see
+tests/board_state.py) that restores what the next test needs, and
+only where needed. State a test needs set up, and no test left in the
+suite sets up, is set up by inserting a setup test.
+'''
+
+import itertools
+
+import parallel
+
+# Tests that put the board back into its default state:
+# (test name, expected seconds, names of state restored or None for all)
+transitions = [('RestoreFirewall', 20, ['port_forward']),
+               ('Remove_IPv6_Addresses', 40, ['ipv6']),
+               ('FactoryReset', 300, None)]
+
+# Tests that set up state: (test name, expected seconds, state set)
+setups = [('Set_IPv6_Addresses', 60, {'ipv6': True})]
+
+
+def declared(test, attr):
+    '''Merge a state dictionary along the class hierarchy of a test.'''
+    cls = test if isinstance(test, type) else test.__class__
+    result = {}
+    for c in reversed(cls.__mro__):
+        result.update(c.__dict__.get(attr, {}))
+    return result
+
+
+def transition_for(state, needs, durations={}):
+    '''
+    Return (cost, list of transition names) that brings the board from
+    state into one meeting needs. State that has to go back to its
+    default is restored, then state in setups is set up. Other
+    differences are left to the tests that set them up.
+    '''
+    undo = set(k for k, v in needs.items() if v is False and state.get(k))
+    combos = [()]
+    if undo:
+        combos = []
+        for n in range(1, len(transitions) + 1):
+            for combo in itertools.combinations(transitions, n):
+                covered = set()
+                for name, seconds, restores in combo:
+                    covered |= set(state) if restores is None else set(restores)
+                if undo <= covered:
+                    combos.append(combo)
+    best = None
+    for combo in combos:
+        steps = [name for name, seconds, restores in combo]
+        cost = sum(durations.get(name, seconds) for name, seconds, restores in combo)
+        after = state
+        for name in steps:
+            after = apply_transition(after, name)
+        # restoring may undo state that is needed, e.g. a factory reset
+        for name, seconds, sets in setups:
+            if any(needs.get(k) == v and after.get(k) != v for k, v in sets.items()):
+                steps.append(name)
+                cost += durations.get(name, seconds)
+        if best is None or cost < best[0]:
+            best = (cost, steps)
+    return best
+
+
+def apply_transition(state, name):
+    '''Return state after running the named transition.'''
+    for t, seconds, restores in transitions:
+        if t == name:
+            if restores is None:
+                return {}
+            return dict((k, v) for k, v in state.items() if k not in restores)
+    for t, seconds, sets in setups:
+        if t == name:
+            return dict(state, **sets)
+    return state
+
+
+def plan(tests, make_test, durations={}):
+    '''
+    Reorder a list of test instances, inserting transition tests made by
+    make_test(name) where needed. Leading boot tests and a final Interact
+    stay where they are. A test is only moved after the tests it
+    depends on, and after the tests that set up state it requires.
+    Return the new list.
+    '''
+    head = []
+    for t in tests:
+        if t.__class__.__name__ not in parallel.boot_tests:
+            break
+        head.append(t)
+    body = tests[len(head):]
+    tail = []
+    if body and body[-1].__class__.__name__ == "Interact":
+        tail = [body.pop()]
+
+    requires = [declared(t, 'requires_state') for t in body]
+    changes = [declared(t, 'changes_state') for t in body]
+    pending = list(range(len(body)))
+    state = {}
+    result = []
+    while pending:
+        names = set(body[i].__class__.__name__ for i in pending)
+        candidates = []
+        for i in pending:
+            if any(d in names for d in getattr(body[i], 'depends_on', [])):
+                continue
+            # wait for a test that sets up what this one needs, and
+            # needs nothing set up itself
+            if any(v and not state.get(k) and
+                   any(changes[j].get(k) == v and not requires[j].get(k) for j in pending if j != i)
+                   for k, v in requires[i].items()):
+                continue
+            cost, steps = transition_for(state, requires[i], durations)
+            # count the cost of undoing what other tests still need
+            for k, v in changes[i].items():
+                if v and any(requires[j].get(k) is False for j in pending if j != i):
+                    cost += transition_for({k: v}, {k: False}, durations)[0]
+            candidates.append((cost, i, steps))
+        if not candidates:
+            # dependency loop or missing test, keep suite order
+            candidates = [(0, pending[0], [])]
+        cost, i, steps = min(candidates)
+        for name in steps:
+            result.append(make_test(name))
+            state = apply_transition(state, name)
+        result.append(body[i])
+        state.update(changes[i])
+        pending.remove(i)
+    return head + result + tail
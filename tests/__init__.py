@@ -4,15 +4,140 @@
 #
 # This file is distributed under the Clear BSD license.
 # The full text can be found in LICENSE in the root directory.
-import lib
+'''
+Find tests without importing every test file.
 
-# Import from every file
-import os
+Test files are parsed (not imported) to build a registry of
+test class name -> module, docstring and declared dependencies. The
+registry is cached in a json file next to the tests and a file is only
+parsed again when it changes. A test module is imported when one of
+its tests is asked for.
+'''
+import ast
 import glob
-test_files = glob.glob(os.path.dirname(__file__)+"/*.py")
-for x in sorted([os.path.basename(f)[:-3] for f in test_files if not "__" in f]):
+import json
+import os
+
+import lib
+
+test_dir = os.path.dirname(os.path.realpath(__file__))
+cache_file = os.path.join(test_dir, '.test_registry.json')
+cache_version = 1
+
+# Base classes of all tests
+test_bases = ['TestCase']
+
+_registry = None
+
+
+def _parse_file(fname):
+    '''Return list of classes defined in a test file, as dictionaries.'''
+    tree = ast.parse(open(fname).read(), fname)
+    classes = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = []
+        for b in node.bases:
+            # "rootfs_boot.RootFSBootTest" -> "RootFSBootTest"
+            if isinstance(b, ast.Attribute):
+                bases.append(b.attr)
+            elif isinstance(b, ast.Name):
+                bases.append(b.id)
+        depends_on = None
+        for stmt in node.body:
+            if isinstance(stmt, ast.Assign) and \
+               any(getattr(t, 'id', None) == 'depends_on' for t in stmt.targets) and \
+               isinstance(stmt.value, (ast.List, ast.Tuple)):
+                depends_on = [e.s for e in stmt.value.elts if isinstance(e, ast.Str)]
+        doc = ast.get_docstring(node) or ""
+        classes.append({'name': node.name,
+                        'bases': bases,
+                        'doc': doc.split('\n')[0],
+                        'depends_on': depends_on})
+    return classes
+
+
+def _load_cache():
     try:
-        exec("from %s import *" % x)
+        data = json.load(open(cache_file))
+        if data.get('version') == cache_version:
+            return data['files']
+    except:
+        pass
+    return {}
+
+
+def _save_cache(files):
+    try:
+        json.dump({'version': cache_version, 'files': files},
+                  open(cache_file, 'w'), indent=1, sort_keys=True)
     except Exception as e:
+        # Not being able to cache is no reason to stop
         print(e)
-        print("Warning: could not import from file %s." % x)
+
+
+def _scan():
+    '''Return dictionary of module name -> classes, using cache when valid.'''
+    cached = _load_cache()
+    files = {}
+    changed = False
+    for fname in sorted(glob.glob(os.path.join(test_dir, '*.py'))):
+        module = os.path.basename(fname)[:-3]
+        if "__" in module:
+            continue
+        mtime = os.path.getmtime(fname)
+        entry = cached.get(module)
+        if entry is None or entry['mtime'] != mtime:
+            try:
+                entry = {'mtime': mtime, 'classes': _parse_file(fname)}
+            except Exception as e:
+                print(e)
+                print("Warning: could not parse file %s." % module)
+                continue
+            changed = True
+        files[module] = entry
+    if changed or set(files) != set(cached):
+        _save_cache(files)
+    return files
+
+
+def registry(refresh=False):
+    '''
+    Return dictionary of test name -> {'module', 'doc', 'depends_on'}
+    for every class in the test files that derives from a TestCase.
+    '''
+    global _registry
+    if _registry is not None and not refresh:
+        return _registry
+    files = _scan()
+    classes = {}
+    # As with "from x import *" of every file, later files win
+    for module in sorted(files):
+        for c in files[module]['classes']:
+            classes[c['name']] = dict(c, module=module)
+    # Keep every class whose base is, in turn, a test
+    tests = set()
+    while True:
+        found = set(n for n, c in classes.items()
+                    if n not in tests and
+                    any(b in tests or b in test_bases for b in c['bases']))
+        if not found:
+            break
+        tests |= found
+    _registry = dict((n, {'module': classes[n]['module'],
+                          'doc': classes[n]['doc'],
+                          'depends_on': classes[n]['depends_on']})
+                     for n in tests)
+    return _registry
+
+
+def get_test(name, reload_module=False):
+    '''Import the module defining the named test and return the test class.'''
+    info = registry(refresh=reload_module).get(name)
+    if info is None:
+        raise AttributeError("No test named %s" % name)
+    mod = __import__('tests.%s' % info['module'], fromlist=[name])
+    if reload_module:
+        mod = reload(mod)
+    return getattr(mod, name)
@@ -0,0 +1,39 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+# Tests that undo state left behind by other tests. The planner
+# (planner.py) inserts them into a suite where needed, along with
+# Remove_IPv6_Addresses and Set_IPv6_Addresses from ipv6_setup.py.
+
+import rootfs_boot
+from devices import board, wan, lan, wlan, prompt
+
+class RestoreFirewall(rootfs_boot.RootFSBootTest):
+    '''Removed port forwards added by earlier tests.'''
+    requires_state = {'bridged': None}
+    changes_state = {'port_forward': False}
+    def runTest(self):
+        # only redirects and rules added by board.uci_forward_traffic_*(),
+        # one at a time, as deleting one renumbers @redirect[N] sections
+        board.sendline("while s=$( (uci -X show firewall 2>/dev/null || uci show firewall) | "
+                       "grep \"\\.name='\\?%s'\\?$\" | head -n 1 | cut -d. -f2) && [ -n \"$s\" ]; "
+                       "do uci delete firewall.$s || break; done"
+                       % board.firewall_name)
+        board.expect(prompt)
+        board.sendline('uci commit firewall')
+        board.expect(prompt)
+        board.firewall_restart()
+
+class FactoryReset(rootfs_boot.RootFSBootTest):
+    '''Restored default settings and rebooted router.'''
+    requires_state = {'bridged': None}
+    def runTest(self):
+        board.sendline('firstboot -y')
+        board.expect(prompt, timeout=60)
+        # firstboot removes installed packages too, boot() installs
+        # them again
+        self.boot(reflash=False)
@@ -11,6 +11,8 @@ from devices import board, wan, lan, wlan, prompt
 
 class BridgedMode(rootfs_boot.RootFSBootTest):
     '''Puts router in bridged mode (other tests may not work after running this)'''
+    requires_state = {'bridged': None}
+    changes_state = {'bridged': True}
     def runTest(self):
         board.sendline('uci set network.lan.ifname="%s %s"' % (board.wan_iface, board.lan_iface))
         board.expect(prompt)
@@ -7,18 +7,15 @@
 
 import rootfs_boot
 import lib
-import os
 import sys
-import glob
+import tests
 from devices import board, wan, lan, wlan, prompt
 
-def print_subclasses(cls):
-    for x in cls.__subclasses__():
-        print(x.__name__)
-        print_subclasses(x)
-
 class Interact(rootfs_boot.RootFSBootTest):
     '''Interact with console, wan, lan, wlan connections and re-run tests'''
+    # other devices are connected to when entering their console
+    required_devices = ['board']
+
     def runTest(self):
 
         lib.common.test_msg("Press Ctrl-] to stop interaction and return to menu")
@@ -56,36 +53,25 @@ class Interact(rootfs_boot.RootFSBootTest):
             elif key == "4":
                 wlan.interact()
             elif key == "5":
-                try:
-                    # re import the tests
-                    test_files = glob.glob(os.path.dirname(__file__)+"/*.py")
-                    for x in sorted([os.path.basename(f)[:-3] for f in test_files if not "__" in f]):
-                        exec("from %s import *" % x)
-                except:
-                    print("Unable to re-import tests!")
-                else:
-                    # list what we can re-run
-                    rfs_boot = rootfs_boot.RootFSBootTest
-                    print("Available tests:")
-                    print_subclasses(rfs_boot)
+                # list what we can re-run
+                print("Available tests:")
+                for name in sorted(tests.registry(refresh=True)):
+                    print(name)
             elif key == "6":
+                # TODO: use an index instead of test name
+                print("Type test to run: ")
+                test = sys.stdin.readline().strip()
                 try:
-                    # re import the tests
-                    test_files = glob.glob(os.path.dirname(__file__)+"/*.py")
-                    for x in sorted([os.path.basename(f)[:-3] for f in test_files if not "__" in f]):
-                        exec("from %s import *" % x)
-                except:
-                    print("Unable to re-import tests!")
+                    # re import the test, it may have been edited
+                    t = tests.get_test(test, reload_module=True)
+                except Exception as e:
+                    print(e)
+                    print("Unable to re-import test!")
                 else:
-                    # TODO: use an index instead of test name
-                    print("Type test to run: ")
-                    test = sys.stdin.readline()
-
                     try:
                         board.sendline()
                         board.sendline('echo \"1 1 1 7\" > /proc/sys/kernel/printk')
                         board.expect(prompt)
-                        t = eval(test)
                         cls = t(self.config)
                         lib.common.test_msg("\n==================== Begin %s ====================" % cls.__class__.__name__)
                         cls.testWrapper()
@@ -11,7 +11,7 @@ import rootfs_boot
 import ipv6_setup
 import lib
 from lib import streamboost, installers
-from devices import board, wan, lan, wlan, prompt
+from devices import board, wan, lan, wlan, prompt, tasks
 
 # change this if you want to one time tweak iperf opts
 time = 60
@@ -50,9 +50,13 @@ class iPerfUDPTest(rootfs_boot.RootFSBootTest):
         client.expect('Client connecting to')
 
     def parse_iperf(self, client, connections=conns, t=time):
+        return tasks.gather(self.parse_iperf_task(client, connections, t))[0]
+
+    def parse_iperf_task(self, client, connections=conns, t=time):
+        '''parse_iperf() as a task, to read several clients at once.'''
         rate = 0.0
         for i in range(0, connections):
-            m = client.expect([' (\d\S+) Mbits/sec', '(\d\S+) Kbits/sec' ], timeout=t+30)
+            m = yield client.expect_task([' (\d\S+) Mbits/sec', '(\d\S+) Kbits/sec' ], timeout=t+30)
             if m == 0:
                 rate += float(client.match.group(1))
             elif m == 1:
@@ -61,8 +65,8 @@ class iPerfUDPTest(rootfs_boot.RootFSBootTest):
                 lib.common.test_msg("Unknown units for iPerf results!\n")
                 assert False
 
-        client.expect(prompt)
-        return rate
+        yield client.expect_task(prompt)
+        raise tasks.Return(rate)
 
     def kill_iperf(self, client):
         client.sendline("killall -9 iperf")
@@ -136,6 +140,7 @@ class iPerfUDPTest(rootfs_boot.RootFSBootTest):
 
 class iPerfUDPTestWLAN(iPerfUDPTest):
     '''iPerf from LAN to WAN over Wifi'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
 
     def runTest(self):
         if not wlan:
@@ -146,6 +151,7 @@ class iPerfUDPTestWLAN(iPerfUDPTest):
 
 class iPerfUDPTestIPV6(ipv6_setup.Set_IPv6_Addresses, iPerfUDPTest):
     '''iPerf IPV6 from LAN to WAN'''
+    requires_state = {'ipv6': True}
 
     def forward_ip(self):
         return "5aaa::6"
@@ -174,6 +180,8 @@ class iPerfUDPNonRoutedTest(iPerfUDPTest):
 
 class iPerfUDPReverseTest(iPerfUDPTest):
     '''iPerf from WAN to LAN'''
+    # forwards a port from WAN to the server
+    changes_state = {'port_forward': True}
 
     def runTest(self, client=wan, server=lan):
         mpstat_present = self.mpstat_ok()
@@ -211,6 +219,7 @@ class iPerfUDPReverseTest(iPerfUDPTest):
 
 class iPerfUDPReverseTestWLAN(iPerfUDPReverseTest):
     '''iPerf from WAN to LAN over Wifi'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
 
     def runTest(self):
         if not wlan:
@@ -224,6 +233,7 @@ class iPerfUDPReverseTestWLAN(iPerfUDPReverseTest):
 
 class iPerfUDPReverseTestIPV6(ipv6_setup.Set_IPv6_Addresses, iPerfUDPReverseTest):
     '''iPerf IPV6 from WAN to LAN'''
+    requires_state = {'ipv6': True}
     def reverse_ip(self):
         return "4aaa::6"
 
@@ -240,6 +250,8 @@ class iPerfUDPReverseTestIPV6(ipv6_setup.Set_IPv6_Addresses, iPerfUDPReverseTest
 
 class iPerfUDPBiDirTest(iPerfUDPTest):
     '''iPerf from LAN to/from WAN'''
+    # forwards a port from WAN to the server
+    changes_state = {'port_forward': True}
     def runTest(self, node1=lan, node2=wan):
         mpstat_present = self.mpstat_ok()
 
@@ -251,9 +263,9 @@ class iPerfUDPBiDirTest(iPerfUDPTest):
             board.expect('Linux')
         self.run_iperf(node2, opts=opts, target=self.reverse_ip())
         self.run_iperf(node1, opts=opts)
-        rate = 0.0
-        rate += float(self.parse_iperf(node1))
-        rate += float(self.parse_iperf(node2))
+        # read both clients as results come, instead of one after the other
+        rate1, rate2 = tasks.gather(self.parse_iperf_task(node1), self.parse_iperf_task(node2))
+        rate = float(rate1) + float(rate2)
         if mpstat_present:
             board.sendcontrol('c')
             board.expect('Average.*idle\r\nAverage:\s+all(\s+[0-9]+.[0-9]+){10}\r\n')
@@ -285,6 +297,7 @@ class iPerfUDPBiDirTest(iPerfUDPTest):
 
 class iPerfUDPBiDirTestWLAN(iPerfUDPBiDirTest):
     '''iPerf from WAN to LAN over Wifi'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
 
     def runTest(self):
         if not wlan:
@@ -298,6 +311,7 @@ class iPerfUDPBiDirTestWLAN(iPerfUDPBiDirTest):
 
 class iPerfUDPBiDirTestIPV6(ipv6_setup.Set_IPv6_Addresses, iPerfUDPBiDirTest):
     '''iPerf IPV6 from LAN to/from WAN'''
+    requires_state = {'ipv6': True}
     def reverse_ip(self):
         return "4aaa::6"
 
@@ -10,6 +10,8 @@ from devices import board, wan, lan, wlan, prompt
 
 class IPv6_File_Download(rootfs_boot.RootFSBootTest):
     '''Downloaded file through router using IPv6.'''
+    depends_on = ['Set_IPv6_Addresses']
+    requires_state = {'ipv6': True}
     def runTest(self):
         # WAN Device: create large file in web directory
         fname = "/var/www/20mb.txt"
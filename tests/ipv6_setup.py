@@ -10,52 +10,34 @@ import time
 import rootfs_boot
 
 from devices import board, wan, lan, wlan, prompt
-from lib.common import run_once
 
 class Set_IPv6_Addresses(rootfs_boot.RootFSBootTest):
     '''Set IPv6 addresses and default routes for router and devices.'''
-    @run_once
+    changes_state = {'ipv6': True}
     def runTest(self):
+        # Tests using IPv6 run this first, it is only needed once per boot
+        boot_id = getattr(board, 'boot_id', None)
+        if boot_id is not None and getattr(board, 'ipv6_boot_id', None) == boot_id:
+            return
         # Router
-        board.sendline('uci set network.lan6=interface')
-        board.expect(prompt)
-        board.sendline('uci set network.lan6.proto=static')
-        board.expect(prompt)
-        board.sendline('uci set network.lan6.ip6addr=4aaa::1/64')
-        board.expect(prompt)
-        board.sendline('uci set network.lan6.ifname=@lan')
-        board.expect(prompt)
-        board.sendline('uci set network.wan6=interface')
-        board.expect(prompt)
-        board.sendline('uci set network.wan6.proto=static')
-        board.expect(prompt)
-        board.sendline('uci set network.wan6.ip6addr=5aaa::1/64')
-        board.expect(prompt)
-        board.sendline('uci set network.wan6.ifname=@wan')
-        board.expect(prompt)
-        board.sendline('uci commit network')
-        board.expect(prompt)
+        board.run_batch(['uci set network.lan6=interface',
+                         'uci set network.lan6.proto=static',
+                         'uci set network.lan6.ip6addr=4aaa::1/64',
+                         'uci set network.lan6.ifname=@lan',
+                         'uci set network.wan6=interface',
+                         'uci set network.wan6.proto=static',
+                         'uci set network.wan6.ip6addr=5aaa::1/64',
+                         'uci set network.wan6.ifname=@wan',
+                         'uci commit network'], check=False)
         board.network_restart()
-        # Lan-side Device
-        lan.sendline('\nip -6 addr add 4aaa::6/64 dev eth1')
-        lan.expect('ip -6')
-        lan.expect(prompt)
-        lan.sendline('ip -6 route add 4aaa::1 dev eth1')
-        lan.expect(prompt)
-        lan.sendline('ip -6 route add default via 4aaa::1 dev eth1')
-        lan.expect(prompt)
-        if 'No route to host' in lan.before:
-            raise Exception('Error setting ivp6 routes')
-        # Wan-side Device
-        wan.sendline('\nip -6 addr add 5aaa::6/64 dev eth1')
-        wan.expect('ip -6')
-        wan.expect(prompt)
-        wan.sendline('ip -6 route add 5aaa::1 dev eth1')
-        wan.expect(prompt)
-        wan.sendline('ip -6 route add default via 5aaa::1 dev eth1')
-        wan.expect(prompt)
-        if 'No route to host' in wan.before:
-            raise Exception('Error setting ivp6 routes')
+        # Lan-side and Wan-side Devices
+        for dev, net in ((lan, '4aaa'), (wan, '5aaa')):
+            dev.run('ip -6 addr add %s::6/64 dev eth1' % net)
+            dev.run('ip -6 route add %s::1 dev eth1' % net)
+            r = dev.run('ip -6 route add default via %s::1 dev eth1' % net)
+            # the route may be left from an earlier run
+            if not r and 'File exists' not in r.output:
+                raise Exception('Error setting ipv6 routes: %s' % r.output)
         # Wlan-side Device
         if wlan:
             wlan.sendline('\nip -6 addr add 4aaa::7/64 dev wlan0')
@@ -77,31 +59,26 @@ class Set_IPv6_Addresses(rootfs_boot.RootFSBootTest):
         wan.sendline('\nifconfig | grep -B2 addr:')
         wan.expect('ifconfig ')
         wan.expect(prompt)
+        board.ipv6_boot_id = boot_id
 
 
 class Remove_IPv6_Addresses(rootfs_boot.RootFSBootTest):
     '''Removed IPv6 addresses and default routes for router and devices.'''
+    requires_state = {'bridged': None}
+    changes_state = {'ipv6': False}
     def runTest(self):
-        board.sendline('\nuci delete network.lan.ip6addr')
-        board.expect('uci ')
-        board.expect(prompt)
-        board.sendline('uci delete network.wan.ip6addr')
-        board.expect(prompt)
-        board.sendline('ip -6 addr delete 5aaa::1/64 dev eth0')
-        board.expect(prompt)
-        board.sendline('uci commit network')
-        board.expect(prompt)
+        board.run_batch(['uci -q delete network.lan6',
+                         'uci -q delete network.wan6',
+                         'uci commit network'], check=False)
         board.network_restart()
-        # Lan-side Device
-        lan.sendline('\nip -6 addr del 4aaa::6/64 dev eth1')
-        lan.expect('ip -6')
-        lan.expect(prompt)
-        lan.sendline('ip -6 route del default')
-        lan.expect(prompt)
-        # Wan-side Device
-        wan.sendline('\nip -6 addr del 5aaa::6/64 dev eth1')
-        wan.expect('ip -6')
-        wan.expect(prompt)
-        wan.sendline('ip -6 route del default')
-        wan.expect(prompt)
-        time.sleep(10)
+        board.ipv6_boot_id = None
+        # Lan-side and Wan-side Devices
+        for dev, net in ((lan, '4aaa'), (wan, '5aaa')):
+            dev.run_batch(['ip -6 route del default via %s::1 dev eth1' % net,
+                           'ip -6 route del %s::1 dev eth1' % net,
+                           'ip -6 addr del %s::6/64 dev eth1' % net], check=False)
+        # Wlan-side Device
+        if wlan:
+            wlan.run_batch(['ip -6 route del default via 4aaa::1 dev wlan0',
+                            'ip -6 route del 4aaa::1 dev eth1',
+                            'ip -6 addr del 4aaa::7/64 dev wlan0'], check=False)
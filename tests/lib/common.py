@@ -17,13 +17,11 @@ import urllib2
 import os
 import signal
 from termcolor import cprint
-
-from selenium import webdriver
-from selenium.webdriver.common.proxy import *
+from devices.prompts import Prompt
 
 ubootprompt = ['ath>', '\(IPQ\) #', 'ar7240>']
 linuxprompt = ['root\\@.*:.*#', '@R7500:/# ']
-prompts = ubootprompt + linuxprompt + ['/.* # ', ]
+prompts = Prompt(ubootprompt + linuxprompt + ['/.* # ', ])
 
 def run_once(f):
     def wrapper(*args, **kwargs):
@@ -84,6 +82,7 @@ def phantom_webproxy_driver(ipport):
     '''
     Use this if you started web proxy on a machine connected to router's LAN.
     '''
+    from selenium import webdriver
     service_args = [
         '--proxy=' + ipport,
         '--proxy-type=http',
@@ -98,6 +97,8 @@ def firefox_webproxy_driver(ipport):
     '''
     Use this if you started web proxy on a machine connected to router's LAN.
     '''
+    from selenium import webdriver
+    from selenium.webdriver.common.proxy import Proxy
     proxy = Proxy({
             'proxyType': 'MANUAL',
             'httpProxy': ipport,
@@ -11,10 +11,24 @@ import lib
 import sys
 import traceback
 
+import devices
 from devices import board, wan, lan, wlan, prompt
 
 class LinuxBootTest(unittest2.TestCase):
 
+    # Names of tests that must run earlier on the same board
+    # for this test to work, e.g. ['Set_IPv6_Addresses']
+    depends_on = []
+
+    # Devices this test uses, connected to before the suite starts.
+    # The test is skipped if one of them cannot be connected to.
+    required_devices = ['board']
+
+    # Board state this test needs and state it leaves behind, used to
+    # order tests (see planner.py), e.g. {'port_forward': True}
+    requires_state = {}
+    changes_state = {}
+
     def __init__(self, config):
         super(LinuxBootTest, self).__init__("testWrapper")
         self.config = config
@@ -28,6 +42,8 @@ class LinuxBootTest(unittest2.TestCase):
     def setUp(self):
         lib.common.test_msg("\n==================== Begin %s ====================" % self.__class__.__name__)
     def tearDown(self):
+        if hasattr(self, 'start_time'):
+            self.duration = time.time() - self.start_time
         lib.common.test_msg("\n==================== End %s ======================" % self.__class__.__name__)
 
     def wan_setup(self):
@@ -49,17 +65,23 @@ class LinuxBootTest(unittest2.TestCase):
         None
 
     def testWrapper(self):
+        self.start_time = time.time()
         if not board.isalive():
             self.result_grade = "SKIP"
             self.skipTest("Board is not alive")
             raise
 
+        for d in self.required_devices:
+            if not devices.available(d):
+                self.result_grade = "SKIP"
+                self.skipTest("%s device is unavailable" % d)
+
         try:
-            if wan and hasattr(self, 'wan_setup'):
+            if 'wan' in self.required_devices and wan and hasattr(self, 'wan_setup'):
                 self.wan_setup()
-            if lan and hasattr(self, 'lan_setup'):
+            if 'lan' in self.required_devices and lan and hasattr(self, 'lan_setup'):
                 self.lan_setup()
-            if wlan and hasattr(self, 'wlan_setup'):
+            if 'wlan' in self.required_devices and wlan and hasattr(self, 'wlan_setup'):
                 self.wlan_setup()
 
             if self.config.retry and not self.dont_retry:
@@ -80,11 +102,11 @@ class LinuxBootTest(unittest2.TestCase):
                     else:
                         raise
 
-            if wan and hasattr(self, 'wan_cleanup'):
+            if 'wan' in self.required_devices and wan and hasattr(self, 'wan_cleanup'):
                 self.wan_cleanup()
-            if lan and hasattr(self, 'lan_cleanup'):
+            if 'lan' in self.required_devices and lan and hasattr(self, 'lan_cleanup'):
                 self.lan_cleanup()
-            if wlan and hasattr(self, 'wlan_cleanup'):
+            if 'wlan' in self.required_devices and wlan and hasattr(self, 'wlan_cleanup'):
                 self.wlan_cleanup()
 
             if hasattr(self, 'expected_failure') and self.expected_failure:
@@ -16,6 +16,8 @@ from devices import board, wan, lan, wlan, prompt
 
 class NetperfReverseTest(netperf_test.NetperfTest):
     '''Setup Netperf and Ran Reverse Throughput.'''
+    # forwards a port from WAN to the server
+    changes_state = {'port_forward': True}
     def runTest(self):
         # setup port forwarding to lan netperf server
         lan_priv_ip = lan.get_interface_ipaddr("eth1")
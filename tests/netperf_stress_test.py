@@ -13,7 +13,7 @@ import sys
 import time
 
 from netperf_test import install_netperf
-from devices import board, wan, lan, wlan, prompt
+from devices import board, wan, lan, wlan, prompt, tasks
 
 class NetperfStressTest(netperf_test.NetperfTest):
     @lib.common.run_once
@@ -39,33 +39,32 @@ class NetperfStressTest(netperf_test.NetperfTest):
         opts = '192.168.0.1 -c -C -l %s -- -m %s -M %s -D' % (run_time, pkt_size, pkt_size)
         for i in range(0, num_conn):
             self.run_netperf_cmd_nowait(lan, opts)
-        # Let netperf tests run
-        time.sleep(run_time*1.5)
+        # Read board cpu usage and netperf results as they come, for at
+        # most as long as the old fixed wait. Not all tests might start.
+        deadline = time.time() + run_time*1.5
 
-        board.expect('Average:\s+all.*\s+([0-9]+.[0-9]+)\r\n')
-        idle_cpu = board.match.group(1)
-        avg_cpu = 100 - float(idle_cpu)
-        print("Average cpu usage was %s" % avg_cpu)
+        def cpu_usage():
+            yield board.expect_task('Average:\s+all.*\s+([0-9]+.[0-9]+)\r\n', timeout=run_time*2)
+            raise tasks.Return(100 - float(board.match.group(1)))
+
+        def netperf_speeds():
+            speeds = []
+            try:
+                while len(speeds) < num_conn:
+                    yield lan.expect_task('[0-9]+\s+[0-9]+\s+[0-9]+\s+[0-9]+.[0-9]+\s+([0-9]+.[0-9]+)',
+                                          timeout=max(1, deadline - time.time()))
+                    speeds.append(float(lan.match.group(1)))
+            except pexpect.TIMEOUT as e:
+                # print the exception for logging reasons
+                print(e)
+            raise tasks.Return(speeds)
 
-        # try to flush out backlog of buffer from above, we try b/c not all might start
-        # correctly
-        try:
-            for i in range(0, num_conn):
-                lan.exepct('TEST')
-        except:
-            pass
+        avg_cpu, speeds = tasks.gather(cpu_usage(), netperf_speeds())
+        print("Average cpu usage was %s" % avg_cpu)
 
         # add up as many netperf connections results that were established
-        try:
-            bandwidth = 0.0
-            conns_parsed = 0
-            for i in range(0, num_conn):
-                bandwidth += self.run_netperf_parse(lan, timeout=1) * run_time
-                conns_parsed += 1
-        except Exception as e:
-            # print the exception for logging reasons
-            print(e)
-            pass
+        bandwidth = sum(speeds) * run_time
+        conns_parsed = len(speeds)
 
         # make sure at least one netperf was run
         assert (conns_parsed > 0)
@@ -15,6 +15,8 @@ import time
 from devices import board, wan, lan, wlan, prompt
 
 class NetperfUdpTest(netperf_test.NetperfTest):
+    # forwards a port from WAN to the server
+    changes_state = {'port_forward': True}
     @lib.common.run_once
     def runTest(self):
         super(NetperfUdpTest, self).runTest()
@@ -27,6 +27,7 @@ class Nmap_LAN(rootfs_boot.RootFSBootTest):
 
 class Nmap_WAN(rootfs_boot.RootFSBootTest):
     '''Ran nmap port scanning tool on WAN interface.'''
+    requires_state = {'port_forward': False}
     def recover(self):
         wan.sendcontrol('c')
     def runTest(self):
@@ -150,6 +150,7 @@ class PerfUnalignedPerPktTest(PerfPerPktTest):
 
 class PerfPerPktTestWifi(PerfPerPktTest):
     '''Count various perf events on a per packet basis over wifi'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
     def runTest(self):
         # for wlan since it's not reporting packets properly, we just assign
         # it to None and add logic in the parse section to take the other iface
@@ -10,6 +10,8 @@ from devices import board, wan, lan, wlan, prompt
 
 class LanDevPing6Router(rootfs_boot.RootFSBootTest):
     '''Device on LAN can ping6 router.'''
+    depends_on = ['Set_IPv6_Addresses']
+    requires_state = {'ipv6': True}
     def runTest(self):
         lan.sendline('\nping6 -i 0.2 -c 20 4aaa::1')
         lan.expect('PING ')
@@ -20,6 +22,8 @@ class LanDevPing6Router(rootfs_boot.RootFSBootTest):
 
 class LanDevPing6WanDev(rootfs_boot.RootFSBootTest):
     '''Device on LAN can ping6 through router.'''
+    depends_on = ['Set_IPv6_Addresses']
+    requires_state = {'ipv6': True}
     def runTest(self):
         # Make Lan-device ping Wan-Device
         lan.sendline('\nping6 -i 0.2 -c 20 5aaa::6')
@@ -15,6 +15,7 @@ from devices import board, wan, lan, wlan, prompt
 
 class SshWanDetect(rootfs_boot.RootFSBootTest):
     '''Can access main web GUI page.'''
+    changes_state = {'port_forward': True}
     @lib.common.run_once
     def runTest(self):
         super(SshWanDetect, self).runTest()
@@ -18,6 +18,7 @@ from lib.wifi import *
 
 class WlanAssociate(wlan_set_ssid.WlanSetSSID):
     '''Wifi device connected and had internet access.'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
     def wlan_setup(self):
         wlan.sendline('\napt-get install -qy usbutils wireless-tools')
         wlan.expect('Reading package')
@@ -35,7 +36,7 @@ class WlanAssociate(wlan_set_ssid.WlanSetSSID):
         wlan_iface = wifi_interface(board)
         if wlan_iface is None:
             self.skipTest("No wifi interfaces detected, skipping..")
-        if wlan is None:
+        if not wlan:
             self.skipTest("No wlan VM, skipping test..")
 
         #Determine if we are using a beeliner x86 host. If not, default to usb drivers.
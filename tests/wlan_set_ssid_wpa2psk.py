@@ -15,6 +15,7 @@ from lib.wifi import *
 
 class WlanSetSSID_WPA2PSK(rootfs_boot.RootFSBootTest):
     '''Wifi device came up and was able to set SSID.'''
+    required_devices = ['board', 'wan', 'lan', 'wlan']
     def wlan_setup(self):
         wlan.sendline('\napt-get install -qy firmware-realtek usbutils wireless-tools wpasupplicant')
         wlan.expect('Reading package')
@@ -0,0 +1,79 @@
+# Copyright (c) 2015
+#
+# All rights reserved.
+#
+# This file is distributed under the Clear BSD license.
+# The full text can be found in LICENSE in the root directory.
+
+import fcntl
+import json
+import os
+
+import config
+
+class TestTimings(object):
+    '''
+    Remember how many seconds each test took on each type of board.
+
+    Data is kept in a local json file like:
+
+      {'ap148': {'RootFSBootTest': 412.0, 'iPerfBiDirTest': 185.5, ...},
+       'ap135': {...}
+      }
+
+    Several bft processes may update the file at the same time, so
+    updates are done while holding a lock on the file.
+    '''
+
+    # weight of a new measurement against the stored value
+    weight = 0.5
+
+    def __init__(self, fname=None):
+        if fname is None:
+            fname = config.test_timings_file
+        self.fname = fname
+        self.data = {}
+        try:
+            self.data = json.load(open(self.fname, 'r'))
+        except:
+            pass
+
+    def get(self, board_type, name, default=None):
+        '''Return expected seconds for a test, or default if never seen.'''
+        return self.data.get(board_type, {}).get(name, default)
+
+    def typical(self, board_type, default=60):
+        '''Return median seconds of all known tests for a board type.'''
+        known = sorted(self.data.get(board_type, {}).values())
+        if not known:
+            return default
+        return known[len(known) // 2]
+
+    def update(self, board_type, durations):
+        '''
+        Store new measurements, durations being a list of
+        (test name, seconds) pairs.
+        '''
+        if not durations:
+            return
+        d = os.path.dirname(self.fname)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        with open(self.fname, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                self.data = json.loads(f.read() or '{}')
+            except ValueError:
+                self.data = {}
+            times = self.data.setdefault(board_type, {})
+            for name, seconds in durations:
+                old = times.get(name)
+                if old is None:
+                    times[name] = round(seconds, 1)
+                else:
+                    times[name] = round(old + self.weight * (seconds - old), 1)
+            f.seek(0)
+            f.truncate()
+            json.dump(self.data, f, indent=4, sort_keys=True)
+            fcntl.flock(f, fcntl.LOCK_UN)